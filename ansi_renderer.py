@@ -0,0 +1,119 @@
+import io
+import os
+from rich.console import Console
+from board import EMPTY_ROW, row_cells
+from constants import BOARD_HEIGHT, PALETTE
+
+
+# The playfield renderer is used unless TETRIS_RENDERER=rich
+USE_ANSI_RENDERER = os.getenv("TETRIS_RENDERER", "ansi") != "rich"
+
+# Size of the game frame. The cursor moves below only land on the
+# board when the whole frame fits on the terminal.
+FRAME_WIDTH = 80
+FRAME_HEIGHT = 24
+# Position of the first board cell inside the game frame: below the
+# frame and panel borders, right of the borders and their padding.
+# Each cell is two columns wide.
+BOARD_TOP = 2
+BOARD_LEFT = 4
+CELL_WIDTH = 2
+# rich.Live leaves the cursor on the frame's last row after a refresh
+FRAME_BOTTOM = FRAME_HEIGHT - 1
+
+
+def render_cell(color_system, cell):
+    """ Render a cell's markup to the raw ANSI string rich would emit. """
+    console = Console(
+        file=io.StringIO(),
+        force_terminal=True,
+        color_system=color_system,
+        highlight=False,
+        width=CELL_WIDTH * 4
+    )
+    console.print(cell, end="")
+    return console.file.getvalue()
+
+
+class PlayfieldRenderer:
+    """
+    Draws the board straight onto the terminal, bypassing rich. The
+    last drawn frame is kept as one tuple per row, and only cells that
+    changed since then are written, as cursor moves plus the cell's
+    pre-rendered ANSI style. Rows that are the very same tuple as last
+    time, like the board's shared rows, are skipped without looking at
+    their cells. Moves are relative to where rich.Live leaves the cursor, so
+    the frame can sit anywhere on the screen.
+    """
+    __slots__ = ("console", "color_system", "styles", "previous")
+
+    def __init__(self, console):
+        self.console = console
+        self.color_system = console.color_system
+        self.styles = {
+            cell: render_cell(self.color_system, cell) for cell in PALETTE
+        }
+        self.previous = None
+
+    def style(self, cell):
+        """ Return the ANSI string for a cell, rendering it once. """
+        ansi = self.styles.get(cell)
+        if ansi is None:
+            ansi = self.styles[cell] = render_cell(self.color_system, cell)
+        return ansi
+
+    def fits(self):
+        """ Return True if the terminal can show the whole game frame. """
+        width, height = self.console.size
+        return width >= FRAME_WIDTH and height >= FRAME_HEIGHT
+
+    def invalidate(self):
+        """
+        Note that rich just redrew the whole frame, with the empty
+        board placeholder in the game panel.
+        """
+        self.previous = [row_cells(EMPTY_ROW)] * BOARD_HEIGHT
+
+    def draw(self, grid):
+        """
+        Write the cells of a board grid that differ from the last
+        frame drawn. Returns the number of cells written.
+        """
+        previous = self.previous
+        if previous is None:
+            previous = [()] * BOARD_HEIGHT
+        out = ["\r"]
+        row = FRAME_BOTTOM
+        col = 0
+        written = 0
+        for r, cells in enumerate(grid):
+            last = previous[r]
+            if cells is last:
+                continue
+            # Rows given as lists may be changed in place later on
+            previous[r] = cells if type(cells) is tuple else tuple(cells)
+            for c, cell in enumerate(cells):
+                if c >= len(last) or last[c] != cell:
+                    target_row = BOARD_TOP + r
+                    target_col = BOARD_LEFT + c * CELL_WIDTH
+                    if target_row < row:
+                        out.append(f"\x1b[{row - target_row}A")
+                    elif target_row > row:
+                        out.append(f"\x1b[{target_row - row}B")
+                    if target_col > col:
+                        out.append(f"\x1b[{target_col - col}C")
+                    elif target_col < col:
+                        out.append(f"\x1b[{col - target_col}D")
+                    out.append(self.style(cell))
+                    row = target_row
+                    col = target_col + CELL_WIDTH
+                    written += 1
+        self.previous = previous
+
+        if written:
+            if row < FRAME_BOTTOM:
+                out.append(f"\x1b[{FRAME_BOTTOM - row}B")
+            out.append("\r")
+            self.console.file.write("".join(out))
+            self.console.file.flush()
+        return written
@@ -0,0 +1,314 @@
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import time
+from score_index import ScoreIndex
+
+
+SCOPE = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive.file",
+    "https://www.googleapis.com/auth/drive"
+    ]
+RETRY_INTERVAL = 30
+RECORDS_MAX_AGE = 5
+SQLITE_FILE = "leaderboard.db"
+FAKE_FILE = "leaderboard.jsonl"
+
+
+class LeaderboardUnavailable(Exception):
+    """ Raised when a leaderboard backend cannot be reached. """
+
+
+def score_of(record):
+    """ Return a record's score as an int, treating bad values as 0. """
+    score = record.get("Score", "")
+    return int(score) if str(score).isdigit() else 0
+
+
+class LeaderboardBackend:
+    """
+    Interface for leaderboard storage. Records are dicts with "Name"
+    and "Score" keys, matching the columns of the scores sheet.
+    Remote backends are written through the write-behind queue in
+    highscores.py; local ones are written directly.
+    """
+    remote = False
+
+    def __init__(self):
+        self.rank_index = None
+        self.rank_cursor = None
+        self.rank_lock = threading.Lock()
+
+    def start(self):
+        """ Begin any background connection work. """
+
+    def records(self):
+        """ Return every record on the leaderboard. """
+        raise NotImplementedError
+
+    def top(self, k):
+        """ Return the k highest-scoring records, highest first. """
+        raise NotImplementedError
+
+    def submit_many(self, rows):
+        """ Store a batch of [name, score] rows. """
+        raise NotImplementedError
+
+    def records_since(self, cursor):
+        """
+        Return the records added after cursor, and the cursor to pass
+        next time. A cursor of None returns every record.
+        """
+        raise NotImplementedError
+
+    def submit(self, name, score):
+        """ Store a single score. """
+        self.submit_many([[name, score]])
+
+    def rank_of_score(self, score):
+        """
+        Return the 1-based rank a score would have on the board. By
+        default this keeps a ScoreIndex, adding the records stored
+        since the last call, so a query takes logarithmic time plus
+        the time to read the new records.
+        """
+        with self.rank_lock:
+            records, self.rank_cursor = self.records_since(self.rank_cursor)
+            if self.rank_index is None:
+                self.rank_index = ScoreIndex()
+            for record in records:
+                self.rank_index.add(
+                    record.get("Name", "Anon"), score_of(record)
+                )
+            return self.rank_index.rank(score)
+
+
+class SheetConnection:
+    """
+    Connects to the leaderboard worksheet on a background thread, so
+    the game can start (and be played offline) without waiting on the
+    network. A failed attempt is retried after RETRY_INTERVAL seconds.
+    """
+    def __init__(self):
+        self.sheet = None
+        self.error = None
+        self.failed_at = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        """ Authorize gspread and open the scores worksheet. """
+        import gspread
+        from google.oauth2.service_account import Credentials
+
+        creds = Credentials.from_service_account_file('creds.json')
+        client = gspread.authorize(creds.with_scopes(SCOPE))
+        return client.open("leaderboard").worksheet("scores")
+
+    def run(self):
+        """ Thread target: connect and record the outcome. """
+        try:
+            self.sheet = self.connect()
+        except Exception as e:
+            self.error = e
+            self.failed_at = time.monotonic()
+
+    def start(self):
+        """ Start connecting in the background, if not already. """
+        with self.lock:
+            if self.sheet is not None:
+                return
+            if self.thread is not None and self.thread.is_alive():
+                return
+            if (self.failed_at is not None and
+                    time.monotonic() - self.failed_at < RETRY_INTERVAL):
+                return
+            self.error = None
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def get_sheet(self):
+        """
+        Return the scores worksheet without waiting. Raises
+        LeaderboardUnavailable while a connection is in progress or if
+        the backend cannot be reached.
+        """
+        self.start()
+        if self.sheet is None:
+            raise LeaderboardUnavailable(self.error or "Still connecting")
+        return self.sheet
+
+
+class SheetsBackend(LeaderboardBackend):
+    """
+    Leaderboard stored in the "scores" worksheet of the Google Sheet.
+    Reads download the whole sheet, so they are only done through the
+    leaderboard caches, and one download is shared by reads made
+    within RECORDS_MAX_AGE seconds of each other.
+    """
+    remote = True
+
+    def __init__(self, connection=None):
+        super().__init__()
+        self.connection = connection or SheetConnection()
+        self.last_records = None
+        self.fetched_at = 0.0
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.connection.start()
+
+    def records(self):
+        """ Download every record from the scores sheet. """
+        with self.lock:
+            if (self.last_records is None or
+                    time.monotonic() - self.fetched_at > RECORDS_MAX_AGE):
+                sheet = self.connection.get_sheet()
+                self.last_records = sheet.get_all_records()
+                self.fetched_at = time.monotonic()
+            return self.last_records
+
+    def records_since(self, cursor):
+        """ Download only the rows after the first cursor records. """
+        start = cursor or 0
+        # Row 1 holds the column headers
+        rows = self.connection.get_sheet().get_values(f"A{start + 2}:B")
+        records = [dict(zip(("Name", "Score"), row)) for row in rows]
+        return records, start + len(rows)
+
+    def top(self, k):
+        return heapq.nlargest(k, self.records(), key=score_of)
+
+    def submit_many(self, rows):
+        self.connection.get_sheet().append_rows(rows)
+        with self.lock:
+            self.last_records = None
+
+
+class SQLiteBackend(LeaderboardBackend):
+    """
+    Leaderboard in a local SQLite database with an index on score, so
+    top-k and rank queries walk the index instead of reading the table.
+    """
+    def __init__(self, path=SQLITE_FILE):
+        super().__init__()
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS scores ("
+                "id INTEGER PRIMARY KEY, "
+                "name TEXT NOT NULL, "
+                "score INTEGER NOT NULL)"
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS scores_by_score "
+                "ON scores (score DESC, id)"
+            )
+
+    def records(self):
+        """ Read every record from the table. """
+        with self.lock:
+            rows = self.db.execute("SELECT name, score FROM scores").fetchall()
+        return [{"Name": name, "Score": score} for name, score in rows]
+
+    def records_since(self, cursor):
+        """ Read the rows inserted after row id cursor. """
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, name, score FROM scores WHERE id > ? ORDER BY id",
+                (cursor or 0,)
+            ).fetchall()
+        records = [{"Name": name, "Score": score} for _, name, score in rows]
+        return records, rows[-1][0] if rows else cursor or 0
+
+    def top(self, k):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT name, score FROM scores "
+                "ORDER BY score DESC, id LIMIT ?",
+                (k,)
+            ).fetchall()
+        return [{"Name": name, "Score": score} for name, score in rows]
+
+    def submit_many(self, rows):
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT INTO scores (name, score) VALUES (?, ?)",
+                [(name, int(score)) for name, score in rows]
+            )
+
+    def rank_of_score(self, score):
+        """
+        Count the scores above score on the score index. SQLite walks
+        only the index entries above it, never the table, so the cost
+        grows with the rank rather than with the number of scores.
+        """
+        with self.lock:
+            (higher,) = self.db.execute(
+                "SELECT COUNT(*) FROM scores WHERE score > ?", (score,)
+            ).fetchone()
+        return higher + 1
+
+
+class FileBackend(LeaderboardBackend):
+    """
+    Fake leaderboard kept in a JSON lines file, one [name, score] row
+    per line. Intended for tests and local load runs.
+    """
+    def __init__(self, path=FAKE_FILE):
+        super().__init__()
+        self.path = path
+        self.lock = threading.Lock()
+
+    def records(self):
+        """ Read every record from the file. """
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        return [{"Name": name, "Score": score} for name, score in rows]
+
+    def records_since(self, cursor):
+        """ Read the complete lines after byte offset cursor. """
+        start = cursor or 0
+        if not os.path.exists(self.path):
+            return [], start
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        rows = [json.loads(line) for line in data[:end].splitlines()
+                if line.strip()]
+        records = [{"Name": name, "Score": score} for name, score in rows]
+        return records, start + end
+
+    def top(self, k):
+        with self.lock:
+            return heapq.nlargest(k, self.records(), key=score_of)
+
+    def submit_many(self, rows):
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(
+                    json.dumps([name, int(score)]) + "\n"
+                    for name, score in rows
+                )
+
+
+BACKENDS = {
+    "sheets": SheetsBackend,
+    "sqlite": SQLiteBackend,
+    "file": FileBackend,
+}
+
+
+def create_backend(name):
+    """ Create a leaderboard backend by name. """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown leaderboard backend: {name}")
+    return BACKENDS[name]()
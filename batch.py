@@ -0,0 +1,258 @@
+import numpy as np
+from piece import ROTATIONS
+from bot import best_placement
+from constants import (
+    BOARD_WIDTH,
+    BOARD_HEIGHT,
+    PIECE_POINTS,
+    LINE_POINTS,
+    LINES_PER_LEVEL,
+    LEFT,
+    RIGHT,
+    DOWN,
+    ROTATE
+)
+
+
+FULL_ROW = (1 << BOARD_WIDTH) - 1
+MAX_PIECE_HEIGHT = 4
+
+# Action codes used by the batch simulator, mapped to engine actions
+NO_ACTION, LEFT_ACTION, RIGHT_ACTION, DOWN_ACTION, ROTATE_ACTION = range(5)
+BATCH_ACTIONS = (None, LEFT, RIGHT, DOWN, ROTATE)
+
+SHAPE_NAMES = tuple(ROTATIONS)
+
+
+def build_tables():
+    """
+    Pack the precomputed rotation tables into NumPy arrays indexed by
+    [shape, rotation]: row bitmasks padded to four rows, and widths.
+    """
+    masks = np.zeros(
+        (len(SHAPE_NAMES), 4, MAX_PIECE_HEIGHT), dtype=np.int32
+    )
+    widths = np.zeros((len(SHAPE_NAMES), 4), dtype=np.int32)
+    for k, name in enumerate(SHAPE_NAMES):
+        for rot, state in enumerate(ROTATIONS[name]):
+            masks[k, rot, :state.height] = state.masks
+            widths[k, rot] = state.width
+    return masks, widths
+
+
+MASKS, WIDTHS = build_tables()
+ROW_OFFSETS = np.arange(MAX_PIECE_HEIGHT)
+
+
+def random_policy(sim):
+    """ Pick a uniformly random action code for every board. """
+    return sim.rng.integers(0, len(BATCH_ACTIONS), sim.size)
+
+
+class BotBatchPolicy:
+    """
+    Drives every board with the placement-search bot. A target is
+    planned per board whenever a new piece spawns; the moves towards
+    it are then chosen for all boards at once.
+    """
+    def __init__(self, lookahead=True):
+        self.lookahead = lookahead
+        self.planned = None
+        self.target_rotations = None
+        self.target_cols = None
+
+    def __call__(self, sim):
+        if self.planned is None:
+            self.planned = np.full(sim.size, -1, dtype=np.int64)
+            self.target_rotations = np.zeros(sim.size, dtype=np.int32)
+            self.target_cols = np.zeros(sim.size, dtype=np.int32)
+
+        for i in np.flatnonzero(sim.alive & (sim.pieces != self.planned)):
+            next_name = (
+                SHAPE_NAMES[sim.next_kinds[i]] if self.lookahead else None
+            )
+            target = best_placement(
+                tuple(sim.boards[i, :BOARD_HEIGHT].tolist()),
+                SHAPE_NAMES[sim.kinds[i]],
+                next_name,
+                int(sim.rows[i])
+            )
+            if target is None:
+                target = (sim.rotations[i], sim.cols[i])
+            self.target_rotations[i], self.target_cols[i] = target
+            self.planned[i] = sim.pieces[i]
+
+        return np.select(
+            [
+                sim.rotations != self.target_rotations,
+                sim.cols > self.target_cols,
+                sim.cols < self.target_cols,
+            ],
+            [ROTATE_ACTION, LEFT_ACTION, RIGHT_ACTION],
+            DOWN_ACTION
+        )
+
+
+class BatchSimulator:
+    """
+    Runs many games in lockstep on packed row bitmasks.
+
+    Boards are stored in one (N, BOARD_HEIGHT + 4) int32 array, one row
+    bitmask per entry. The extra rows below the playfield are kept full
+    so they act as the floor in collision checks. Gravity, movement,
+    locking and line clears are applied to all boards at once.
+    Only occupancy is simulated; piece colours are not tracked.
+    """
+    def __init__(self, size, seed=None, piece_points=PIECE_POINTS,
+                 line_points=LINE_POINTS, lines_per_level=LINES_PER_LEVEL):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.piece_points = piece_points
+        self.line_points = line_points
+        self.lines_per_level = lines_per_level
+
+        self.boards = np.zeros(
+            (size, BOARD_HEIGHT + MAX_PIECE_HEIGHT), dtype=np.int32
+        )
+        self.boards[:, BOARD_HEIGHT:] = FULL_ROW
+
+        self.kinds = np.zeros(size, dtype=np.int32)
+        self.rotations = np.zeros(size, dtype=np.int32)
+        self.rows = np.zeros(size, dtype=np.int32)
+        self.cols = np.zeros(size, dtype=np.int32)
+        self.next_kinds = self.random_kinds(size)
+
+        self.score = np.zeros(size, dtype=np.int64)
+        self.lines = np.zeros(size, dtype=np.int64)
+        self.level = np.ones(size, dtype=np.int64)
+        self.pieces = np.zeros(size, dtype=np.int64)
+        self.ticks = np.zeros(size, dtype=np.int64)
+        self.alive = np.ones(size, dtype=bool)
+
+        self.spawn(np.arange(size))
+
+    def random_kinds(self, count):
+        """ Draw random shape indexes. """
+        return self.rng.integers(0, len(SHAPE_NAMES), count)
+
+    def fits(self, idx, rotations, rows, cols):
+        """
+        Check, for the boards in idx, whether their active piece fits
+        with the given rotation and top-left position.
+        """
+        masks = MASKS[self.kinds[idx], rotations]
+        shifted = masks << np.maximum(cols, 0)[:, None]
+        row_idx = rows[:, None] + ROW_OFFSETS
+        cells = self.boards[idx[:, None], row_idx]
+        return (
+            (cols >= 0)
+            & ~(shifted & ~FULL_ROW).any(axis=1)
+            & ~(cells & shifted).any(axis=1)
+        )
+
+    def spawn(self, idx):
+        """
+        Make the next piece active on the boards in idx and draw new
+        next pieces. Boards whose new piece does not fit are game over.
+        """
+        kinds = self.next_kinds[idx]
+        self.kinds[idx] = kinds
+        self.next_kinds[idx] = self.random_kinds(len(idx))
+        self.rotations[idx] = 0
+        self.rows[idx] = 0
+        self.cols[idx] = BOARD_WIDTH // 2 - WIDTHS[kinds, 0] // 2
+        ok = self.fits(idx, self.rotations[idx], self.rows[idx],
+                       self.cols[idx])
+        self.alive[idx[~ok]] = False
+
+    def apply_actions(self, actions):
+        """ Apply one action code per board to the active pieces. """
+        actions = np.asarray(actions)
+        for code, dr, dc, drot in (
+            (LEFT_ACTION, 0, -1, 0),
+            (RIGHT_ACTION, 0, 1, 0),
+            (DOWN_ACTION, 1, 0, 0),
+            (ROTATE_ACTION, 0, 0, 1),
+        ):
+            idx = np.flatnonzero(self.alive & (actions == code))
+            if not len(idx):
+                continue
+            rotations = (self.rotations[idx] + drot) % 4
+            rows = self.rows[idx] + dr
+            cols = self.cols[idx] + dc
+            ok = self.fits(idx, rotations, rows, cols)
+            idx = idx[ok]
+            self.rotations[idx] = rotations[ok]
+            self.rows[idx] = rows[ok]
+            self.cols[idx] = cols[ok]
+
+    def apply_gravity(self):
+        """
+        Move every active piece down one row, locking, clearing lines,
+        scoring and spawning on boards where it cannot fall further.
+        """
+        idx = np.flatnonzero(self.alive)
+        self.ticks[idx] += 1
+        can_fall = self.fits(
+            idx, self.rotations[idx], self.rows[idx] + 1, self.cols[idx]
+        )
+        self.rows[idx[can_fall]] += 1
+
+        locked = idx[~can_fall]
+        if not len(locked):
+            return
+
+        masks = MASKS[self.kinds[locked], self.rotations[locked]]
+        row_idx = self.rows[locked][:, None] + ROW_OFFSETS
+        self.boards[locked[:, None], row_idx] |= (
+            masks << self.cols[locked][:, None]
+        )
+
+        playfield = self.boards[locked, :BOARD_HEIGHT]
+        full = playfield == FULL_ROW
+        cleared = full.sum(axis=1)
+        # A stable sort on "not full" moves full rows to the top while
+        # keeping the remaining rows in order; they are then emptied.
+        order = np.argsort(~full, axis=1, kind="stable")
+        playfield = np.take_along_axis(playfield, order, axis=1)
+        playfield[np.arange(BOARD_HEIGHT) < cleared[:, None]] = 0
+        self.boards[locked, :BOARD_HEIGHT] = playfield
+
+        self.pieces[locked] += 1
+        self.score[locked] += (
+            self.piece_points + cleared * self.line_points
+        )
+        self.lines[locked] += cleared
+        self.level[locked] += (
+            self.lines[locked] >= self.level[locked] * self.lines_per_level
+        )
+
+        self.spawn(locked)
+
+    def step(self, actions=None):
+        """ Advance all running games by one tick. """
+        if actions is not None:
+            self.apply_actions(actions)
+        self.apply_gravity()
+
+    def run(self, policy=random_policy, max_ticks=100000):
+        """
+        Run until every game is over or max_ticks is reached,
+        asking the policy for one array of action codes per tick.
+        Returns the per-game results.
+        """
+        for _ in range(max_ticks):
+            if not self.alive.any():
+                break
+            self.step(policy(self))
+        return self.results()
+
+    def results(self):
+        """ Return the per-game statistics as a dict of arrays. """
+        return {
+            "score": self.score.copy(),
+            "lines": self.lines.copy(),
+            "level": self.level.copy(),
+            "pieces": self.pieces.copy(),
+            "ticks": self.ticks.copy(),
+        }
@@ -0,0 +1,342 @@
+import argparse
+import asyncio
+import io
+import json
+import platform
+import random
+import socket
+import sys
+import time
+import timeit
+from rich.console import Console
+from board import (
+    FULL_ROW,
+    can_move,
+    lock_piece,
+    add_piece_to_board,
+    board_rows,
+    find_full_rows,
+    clear_lines
+)
+from bot import BotPlayer, placements, best_placement
+from checkpoint import (
+    STATE_BUDGET,
+    CHECKPOINT_BUDGET,
+    SESSION_BUDGET,
+    save_state,
+    load_state,
+    state_size,
+    shared_objects,
+    session_size
+)
+from engine import GameState, step
+from selfplay import POLICIES, play_game
+from server import GameSession
+from user_interface import render_board, build_frame
+
+
+DEFAULT_THRESHOLD = 0.25
+REPEAT = 5
+# Games played per timed run, and the tick cap that keeps bot games
+# (which rarely top out) to a bounded length
+GAMES_PER_RUN = {"random": 50, "bot": 5}
+GAME_MAX_TICKS = 2000
+# Game states are measured against the memory budgets every few ticks
+BUDGET_SAMPLE_TICKS = 25
+# Keys a measured server session is sent, one every interval, and the
+# seed for its pieces and the keys picked; a hard drop in every few
+# keys ends the game
+SESSION_KEYS = (
+    b"\x1b[D", b"\x1b[C", b"\x1b[A", b"\x1b[B", b"\x1b[D", b"\x1b[C", b" "
+)
+SESSION_KEY_INTERVAL = 0.01
+SESSION_SEED = 0
+
+
+def midgame_state(seed=1, pieces=40):
+    """ Play a seeded bot game until a few dozen pieces are placed. """
+    state = GameState(seed)
+    bot = BotPlayer()
+    while state.pieces < pieces and not state.finished:
+        step(state, bot(state))
+    return state
+
+
+def full_rows_board(state, rows=2):
+    """ Copy a board and fill its bottom rows so they clear. """
+    board = state.board.copy()
+    for r in range(len(board.rows) - rows, len(board.rows)):
+        board.rows[r] = FULL_ROW
+    return board
+
+
+def benchmarks():
+    """
+    Return the benchmark cases as (name, callable) pairs. Each callable
+    performs one operation on a fixed, seeded game state.
+    """
+    state = midgame_state()
+    board = state.board
+    piece = state.current_piece
+    grid = add_piece_to_board(piece, board)
+    high_scores_text = "\n".join(
+        f"{i}. Player     {1000 - i * 10}" for i in range(1, 11)
+    )
+    console = Console(file=io.StringIO(), width=80, height=24,
+                      force_terminal=True, color_system="truecolor")
+    clear_board = full_rows_board(state)
+
+    # Rotate a copy, from the same rotation every call, so the piece
+    # the other cases measure never changes
+    spinner = piece.copy()
+
+    def rotate():
+        spinner.rotation = piece.rotation
+        spinner.rotate(board)
+
+    def lock():
+        lock_piece(piece, board.copy())
+
+    def clear():
+        clear_lines(clear_board.copy())
+
+    def render_frame():
+        console.file.seek(0)
+        console.file.truncate()
+        console.print(
+            build_frame(grid, state.next_piece, state.score, high_scores_text)
+        )
+
+    return [
+        ("can_move", lambda: can_move(piece, board, dr=1)),
+        ("get_coords", piece.get_coords),
+        ("rotate", rotate),
+        ("board_copy", board.copy),
+        ("lock_piece", lock),
+        ("add_piece_to_board", lambda: add_piece_to_board(piece, board)),
+        ("board_rows", lambda: board_rows(board, piece, ghost=True)),
+        ("find_full_rows", lambda: find_full_rows(clear_board)),
+        ("clear_lines", clear),
+        ("render_board", lambda: render_board(grid)),
+        ("build_frame", lambda: build_frame(
+            grid, state.next_piece, state.score, high_scores_text
+        )),
+        ("render_frame", render_frame),
+    ]
+
+
+def time_case(func):
+    """ Return the best time per call in nanoseconds. """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=REPEAT, number=number))
+    return best / number * 1e9
+
+
+def time_games(policy, games):
+    """
+    Return seeded headless games per second for a policy. The bot's
+    placement caches are cleared first so every run does the same work.
+    """
+    best = None
+    for _ in range(REPEAT):
+        placements.cache_clear()
+        best_placement.cache_clear()
+        start = time.perf_counter()
+        for seed in range(games):
+            play_game(seed, policy, GAME_MAX_TICKS)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return games / best
+
+
+def measure_state(policy, games):
+    """
+    Play seeded games, sampling each state's memory and checkpoint
+    size. Returns the largest of each; raises AssertionError if a
+    checkpoint does not restore the state it was saved from.
+    """
+    largest_state = largest_checkpoint = 0
+    for seed in range(games):
+        state = GameState(seed)
+        player = POLICIES[policy](random.Random(seed))
+        while not state.finished and state.ticks < GAME_MAX_TICKS:
+            step(state, player(state))
+            if state.ticks % BUDGET_SAMPLE_TICKS and not state.finished:
+                continue
+            data = save_state(state)
+            assert save_state(load_state(data)) == data, (
+                f"checkpoint of {policy} game {seed} at tick "
+                f"{state.ticks} does not round-trip"
+            )
+            largest_state = max(largest_state, state_size(state))
+            largest_checkpoint = max(largest_checkpoint, len(data))
+    return largest_state, largest_checkpoint
+
+
+async def discard(reader):
+    """ Read and throw away everything a session sends. """
+    while await reader.read(65536):
+        pass
+
+
+async def sample_session():
+    """
+    Play one seeded game through a server session over a socket pair,
+    measuring the session after every key. The game's replay is not
+    saved. Returns the largest size.
+    """
+    shared = shared_objects(asyncio.get_running_loop())
+    server_sock, client_sock = socket.socketpair()
+    reader, writer = await asyncio.open_connection(sock=server_sock)
+    client_reader, client_writer = await asyncio.open_connection(
+        sock=client_sock
+    )
+    session = GameSession(reader, writer)
+    session.reader_task = asyncio.create_task(session.read_keys())
+    output = asyncio.create_task(discard(client_reader))
+    game = asyncio.create_task(session.play(SESSION_SEED, replay_dir=""))
+    rng = random.Random(SESSION_SEED)
+    largest = 0
+    try:
+        while not game.done():
+            client_writer.write(rng.choice(SESSION_KEYS))
+            await asyncio.sleep(SESSION_KEY_INTERVAL)
+            if session.driver:
+                largest = max(largest, session_size(session, shared))
+        game.result()
+    finally:
+        session.reader_task.cancel()
+        output.cancel()
+        writer.close()
+        client_writer.close()
+    return largest
+
+
+def check_budgets():
+    """
+    Measure game states and a server session against the memory and
+    checkpoint budgets in checkpoint.py. Returns the budgets document.
+    """
+    largest_state = largest_checkpoint = 0
+    for policy, games in GAMES_PER_RUN.items():
+        state_bytes, checkpoint_bytes = measure_state(policy, games)
+        largest_state = max(largest_state, state_bytes)
+        largest_checkpoint = max(largest_checkpoint, checkpoint_bytes)
+    return {
+        "state_bytes": {"max": largest_state, "budget": STATE_BUDGET},
+        "checkpoint_bytes": {
+            "max": largest_checkpoint, "budget": CHECKPOINT_BUDGET
+        },
+        "session_bytes": {
+            "max": asyncio.run(sample_session()), "budget": SESSION_BUDGET
+        },
+    }
+
+
+def run(selected=None, timed=True):
+    """
+    Run the benchmarks and return the results document. With timed
+    false, only the budgets are checked.
+    """
+    results = {}
+    for name, func in benchmarks() if timed else ():
+        if selected and name not in selected:
+            continue
+        ns = time_case(func)
+        results[name] = {"ns_per_op": ns, "ops_per_sec": 1e9 / ns}
+
+    for policy, games in GAMES_PER_RUN.items() if timed else ():
+        name = f"games_{policy}"
+        if selected and name not in selected:
+            continue
+        rate = time_games(policy, games)
+        results[name] = {"ns_per_op": 1e9 / rate, "ops_per_sec": rate}
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+        "budgets": check_budgets(),
+    }
+
+
+def compare(current, baseline, threshold):
+    """
+    Compare results against a baseline. Returns a list of
+    (name, baseline_ns, current_ns, ratio, regressed) rows.
+    """
+    rows = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        ratio = result["ns_per_op"] / base["ns_per_op"]
+        rows.append((
+            name,
+            base["ns_per_op"],
+            result["ns_per_op"],
+            ratio,
+            ratio > 1 + threshold
+        ))
+    return rows
+
+
+def main():
+    """ Command-line entry point for the benchmark suite. """
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Tetris hot paths and headless games."
+    )
+    parser.add_argument("--json", metavar="PATH",
+                        help="write the results as JSON to PATH")
+    parser.add_argument("--baseline", metavar="PATH",
+                        help="compare against a stored results file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown before failing (0.25 = 25%%)")
+    parser.add_argument("--only", nargs="+", metavar="NAME",
+                        help="run only the named benchmarks")
+    parser.add_argument("--budgets", action="store_true",
+                        help="only check the memory and size budgets")
+    args = parser.parse_args()
+
+    current = run(args.only, timed=not args.budgets)
+
+    for name, result in current["results"].items():
+        print(f"{name:<20} {result['ns_per_op']:>14,.0f} ns/op "
+              f"{result['ops_per_sec']:>14,.1f} ops/s")
+
+    failed = False
+    for name, budget in current["budgets"].items():
+        over = budget["max"] > budget["budget"]
+        print(f"{name:<20} {budget['max']:>14,} max "
+              f"{budget['budget']:>14,} budget"
+              f"{' OVER BUDGET' if over else ''}")
+        failed = failed or over
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+
+    if not args.baseline:
+        return 1 if failed else 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    print(f"\nCompared with {args.baseline}:")
+    for name, base_ns, ns, ratio, regressed in compare(
+        current, baseline, args.threshold
+    ):
+        flag = "REGRESSION" if regressed else "ok"
+        print(f"{name:<20} {base_ns:>12,.0f} -> {ns:>12,.0f} ns/op "
+              f"({ratio:.2f}x) {flag}")
+        failed = failed or regressed
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,67 @@
-import copy
-import time
-from rich.panel import Panel
-from rich.layout import Layout
-from user_interface import (
-    render_board,
-    render_next_panel,
-    render_score_panel,
-    render_controls_panel
-)
-from constants import BOARD_WIDTH, BOARD_HEIGHT, EMPTY
+from functools import lru_cache
+from constants import BOARD_WIDTH, BOARD_HEIGHT, PALETTE, GHOST
+
+
+FULL_ROW = (1 << BOARD_WIDTH) - 1
+COLOR_INDEX = {cell: i for i, cell in enumerate(PALETTE)}
+EMPTY_ROW = bytes(BOARD_WIDTH)
+
+
+class Board:
+    """
+    Bitboard representation of the playfield.
+    Each row is an int bitmask where bit c is set when column c is
+    occupied, and a colour plane holds one immutable bytes object per
+    row, with one palette index per cell. Rows are never modified in
+    place, only replaced, so copies of the board share every row that
+    has not changed since and a copy costs O(rows).
+    A row's bitmask doubles as its fill count (mask.bit_count()), so a
+    row is full exactly when its mask equals FULL_ROW.
+    The height of each column's top block is kept alongside, updated
+    when pieces lock and rows are removed.
+    """
+    __slots__ = ("rows", "colors", "heights")
+
+    def __init__(self, rows=None, colors=None, heights=None):
+        self.rows = rows if rows is not None else [0] * BOARD_HEIGHT
+        self.colors = (
+            colors if colors is not None
+            else [EMPTY_ROW] * BOARD_HEIGHT
+        )
+        self.heights = (
+            heights if heights is not None else column_heights(self.rows)
+        )
+
+    def copy(self):
+        """ Return an independent copy of the board, sharing its rows. """
+        return Board(list(self.rows), list(self.colors), list(self.heights))
+
+    def cell(self, r, c):
+        """ Return the display string for the cell at (r, c). """
+        return PALETTE[self.colors[r][c]]
+
+    def grid(self):
+        """ Return the board as a 2D list of display strings. """
+        return [list(row_cells(colors)) for colors in self.colors]
+
+
+def column_heights(rows):
+    """
+    Return the height of the top block in each column of a list of row
+    bitmasks, scanning down from the top until every column is found.
+    """
+    heights = [0] * BOARD_WIDTH
+    seen = 0
+    for r, row in enumerate(rows):
+        new = row & ~seen
+        while new:
+            low = new & -new
+            heights[low.bit_length() - 1] = BOARD_HEIGHT - r
+            new ^= low
+        seen |= row
+        if seen == FULL_ROW:
+            break
+    return heights
 
 
 def create_board():
@@ -16,95 +69,161 @@ def create_board():
     Create and return an empty game board
     with predefined width and height.
     """
-    return [[EMPTY for _ in range(BOARD_WIDTH)] for _ in range(BOARD_HEIGHT)]
+    return Board()
 
 
-def can_move(piece, board, dr=1, dc=0):
+def shape_masks(shape):
+    """ Convert a shape matrix into one column bitmask per shape row. """
+    return [
+        sum(1 << c for c, val in enumerate(row) if val) for row in shape
+    ]
+
+
+def shape_fits(board, masks, row, col):
     """
-    Check if a piece can move in the specified
-    direction without collisions.
+    Check whether a shape, given as row bitmasks, fits on the board
+    with its top-left corner at (row, col).
     """
-    for r, c in piece.get_coords():
-        nr, nc = r + dr, c + dc
-        if nr >= BOARD_HEIGHT or nc < 0 or nc >= BOARD_WIDTH:
+    if col < 0:
+        return False
+    rows = board.rows
+    for i, mask in enumerate(masks):
+        if not mask:
+            continue
+        r = row + i
+        shifted = mask << col
+        if r >= BOARD_HEIGHT or shifted & ~FULL_ROW:
             return False
-        if board[nr][nc] != EMPTY:
+        if r >= 0 and rows[r] & shifted:
             return False
     return True
 
 
+def can_move(piece, board, dr=1, dc=0):
+    """
+    Check if a piece can move in the specified
+    direction without collisions.
+    """
+    return shape_fits(board, piece.masks, piece.row + dr, piece.col + dc)
+
+
+def drop_distance(piece, board):
+    """
+    Return how many rows a piece can fall. Each column the piece
+    covers is compared with that column's height, so this takes
+    O(piece width); a piece tucked under an overhang falls back to
+    checking one row at a time.
+    """
+    heights = board.heights
+    distance = BOARD_HEIGHT
+    for dc, bottom in piece.state.bottoms:
+        lowest = piece.row + bottom
+        surface = BOARD_HEIGHT - heights[piece.col + dc]
+        if lowest >= surface:
+            break
+        distance = min(distance, surface - lowest - 1)
+    else:
+        return distance
+
+    distance = 0
+    while can_move(piece, board, dr=distance + 1):
+        distance += 1
+    return distance
+
+
 def lock_piece(piece, board):
     """ Permanently place a piece onto the board at its current position. """
+    for i, mask in enumerate(piece.masks):
+        r = piece.row + i
+        if 0 <= r < BOARD_HEIGHT and piece.col >= 0:
+            board.rows[r] |= (mask << piece.col) & FULL_ROW
+    color = COLOR_INDEX[piece.emoji]
+    heights = board.heights
+    changed = {}
     for r, c in piece.get_coords():
         if 0 <= r < BOARD_HEIGHT and 0 <= c < BOARD_WIDTH:
-            board[r][c] = piece.emoji
+            row = changed.get(r)
+            if row is None:
+                row = changed[r] = bytearray(board.colors[r])
+            row[c] = color
+            if BOARD_HEIGHT - r > heights[c]:
+                heights[c] = BOARD_HEIGHT - r
+    for r, row in changed.items():
+        board.colors[r] = bytes(row)
 
 
-def add_piece_to_board(piece, board):
-    """ Create a copy of the board with the active piece visually added. """
-    temp_board = copy.deepcopy(board)
-    for r, c in piece.get_coords():
+@lru_cache(maxsize=1024)
+def row_cells(colors):
+    """ Return the display strings for a row of the colour plane. """
+    return tuple(PALETTE[i] for i in colors)
+
+
+def board_rows(board, piece=None, ghost=False):
+    """
+    Return the board's rows of display strings, top to bottom, with the
+    active piece (and, with ghost=True, the spot where it would land)
+    overlaid. Untouched rows are shared, cached tuples; only rows the
+    piece covers are built fresh, so no grid is copied per frame.
+    """
+    rows = [row_cells(colors) for colors in board.colors]
+    if piece is None:
+        return rows
+    coords = piece.get_coords()
+    cells = []
+    if ghost:
+        distance = drop_distance(piece, board)
+        if distance:
+            cells = [(r + distance, c, GHOST) for r, c in coords]
+    cells += [(r, c, piece.emoji) for r, c in coords]
+    for r, c, cell in cells:
         if 0 <= r < BOARD_HEIGHT and 0 <= c < BOARD_WIDTH:
-            temp_board[r][c] = piece.emoji
-    return temp_board
+            row = rows[r]
+            if type(row) is tuple:
+                row = rows[r] = list(row)
+            row[c] = cell
+    return rows
+
+
+def add_piece_to_board(piece, board, ghost=False):
+    """
+    Create a display grid of the board with the active piece added.
+    With ghost=True, the spot where the piece would land is marked too.
+    """
+    return [list(row) for row in board_rows(board, piece, ghost)]
+
+
+def find_full_rows(board, rows=None):
+    """
+    Return the indexes of the completely filled rows. Pass rows to
+    check only those, e.g. the rows a piece was just locked into.
+    """
+    if rows is None:
+        rows = range(BOARD_HEIGHT)
+    return [
+        r for r in rows
+        if 0 <= r < BOARD_HEIGHT and board.rows[r] == FULL_ROW
+    ]
+
+
+def remove_rows(board, full_rows):
+    """
+    Remove the given rows from the board in place and shift
+    everything above them down.
+    """
+    for idx in sorted(full_rows):
+        del board.rows[idx]
+        board.rows.insert(0, 0)
+        del board.colors[idx]
+        board.colors.insert(0, EMPTY_ROW)
+    if full_rows:
+        board.heights = column_heights(board.rows)
 
 
-def clear_lines(board, live, score, next_piece, high_scores_text):
+def clear_lines(board):
     """
-    Animates and clears full lines with a wiping effect.
+    Clears all full lines and shifts the rows above them down.
     Returns the updated board and number of lines cleared.
     """
-    next_panel = render_next_panel(next_piece)
-    score_panel = render_score_panel(score)
-    controls_panel = render_controls_panel()
-    high_scores_panel = Panel(high_scores_text, title="LEADERBOARD", width=24)
-
-    full_rows = [
-                i for i, row in enumerate(board) if
-                all(cell != EMPTY for cell in row)
-                ]
-    lines_cleared = len(full_rows)
-
-    if lines_cleared == 0:
-        return board, 0
-
-    temp_board = copy.deepcopy(board)
-
-    for idx in full_rows:
-        for col in range(BOARD_WIDTH):
-            temp_board[idx][col] = "[white]▓▓[/white]"
-
-            # Build panels only once per tick
-            game_panel = Panel(
-                render_board(temp_board),
-                title="TETRIS",
-                border_style="bold red",
-                width=24
-            )
-            next_p = Layout(next_panel)
-            score_p = Layout(score_panel)
-            controls_p = Layout(controls_panel)
-            leaderboard_p = Layout(high_scores_panel)
-
-            layout = Layout()
-            layout.split_row(
-                Layout(game_panel, name="game", size=24),
-                Layout(name="sidebar", size=28),
-                Layout(leaderboard_p, name="leaderboard")
-            )
-
-            layout["sidebar"].split_column(
-                next_p,
-                score_p,
-                controls_p
-            )
-
-            live.update(Panel(layout, height=24, width=80, border_style="dim"))
-            time.sleep(0.02)
-
-    # Remove the full rows
-    new_board = [row for i, row in enumerate(board) if i not in full_rows]
-    while len(new_board) < BOARD_HEIGHT:
-        new_board.insert(0, [EMPTY for _ in range(BOARD_WIDTH)])
-
-    return new_board, lines_cleared
+    full_rows = find_full_rows(board)
+    remove_rows(board, full_rows)
+    return board, len(full_rows)
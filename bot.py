@@ -0,0 +1,291 @@
+from functools import lru_cache
+from operator import sub
+from piece import ROTATIONS
+from constants import (
+    BOARD_WIDTH,
+    BOARD_HEIGHT,
+    LEFT,
+    RIGHT,
+    DOWN,
+    ROTATE,
+    HARD_DROP
+)
+
+
+FULL_ROW = (1 << BOARD_WIDTH) - 1
+
+# Heuristic weights for aggregate height, lines cleared, holes and
+# bumpiness, as tuned for the classic 10x20 board
+HEIGHT_WEIGHT = -0.510066
+LINES_WEIGHT = 0.760666
+HOLES_WEIGHT = -0.35663
+BUMPINESS_WEIGHT = -0.184483
+
+# Number of best first placements expanded with the next piece
+BEAM_WIDTH = 2
+CACHE_SIZE = 8192
+
+# The columns set in each row mask, for walking a row's blocks without
+# testing every bit
+COLUMNS = tuple(
+    tuple(c for c in range(BOARD_WIDTH) if mask >> c & 1)
+    for mask in range(1 << BOARD_WIDTH)
+)
+# For each rotation of each shape, the (column, top row, bottom row)
+# offsets of the blocks in every column the shape covers
+COLUMN_SPANS = {
+    name: tuple(
+        tuple(
+            (dc, min(r for r, c in state.offsets if c == dc), bottom)
+            for dc, bottom in state.bottoms
+        )
+        for state in states
+    )
+    for name, states in ROTATIONS.items()
+}
+
+
+def fits(rows, masks, row, col):
+    """ Check whether row bitmasks fit on a board of row masks. """
+    for i, mask in enumerate(masks):
+        r = row + i
+        if r >= BOARD_HEIGHT or rows[r] & (mask << col):
+            return False
+    return True
+
+
+def surface(rows):
+    """
+    Return the highest occupied row of each column (BOARD_HEIGHT for
+    an empty column) and the number of holes: empty cells with a block
+    somewhere above them.
+    """
+    tops = [BOARD_HEIGHT] * BOARD_WIDTH
+    covered = 0
+    holes = 0
+    for r in range(top_row(rows), BOARD_HEIGHT):
+        row = rows[r]
+        for c in COLUMNS[row & ~covered]:
+            tops[c] = r
+        covered |= row
+        holes += (covered & ~row).bit_count()
+        if covered == FULL_ROW:
+            # Every column is covered: each empty cell below is a hole
+            below = rows[r + 1:]
+            holes += BOARD_WIDTH * len(below) - sum(map(int.bit_count, below))
+            break
+    return tops, holes
+
+
+def drop_row(rows, tops, state, row, col):
+    """
+    Return the row a shape in rotation state comes to rest at when
+    dropped from row. Each column the shape covers is compared with
+    that column's top, so this takes O(shape width); a shape tucked
+    under an overhang falls back to checking one row at a time.
+    """
+    rest = BOARD_HEIGHT
+    for dc, bottom in state.bottoms:
+        top = tops[col + dc]
+        if row + bottom >= top:
+            break
+        rest = min(rest, top - bottom - 1)
+    else:
+        return rest
+
+    while fits(rows, state.masks, row + 1, col):
+        row += 1
+    return row
+
+
+def top_row(rows):
+    """ Return the index of the highest non-empty row. """
+    for r, row in enumerate(rows):
+        if row:
+            return r
+    return BOARD_HEIGHT
+
+
+def place(rows, masks, row, col):
+    """
+    Lock a shape into a board of row masks and clear full lines.
+    Returns the new rows and the number of lines cleared.
+    """
+    new_rows = list(rows)
+    for i, mask in enumerate(masks):
+        new_rows[row + i] |= mask << col
+    kept = [r for r in new_rows if r != FULL_ROW]
+    lines = BOARD_HEIGHT - len(kept)
+    return (0,) * lines + tuple(kept), lines
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def placements(rows, shape_name, row=0):
+    """
+    Enumerate every placement reachable from the spawn column and
+    rotation at row, the way BotPlayer plays it: rotate, then slide
+    sideways, then hard drop. Gravity moves the piece down a row after
+    every action, so each step is checked one row lower than the last;
+    a piece that can't fall any further locks where it is.
+    Returns a tuple of (rotation, col, rows_after, lines_cleared,
+    score), where score is evaluate(rows_after, lines_cleared).
+    """
+    states = ROTATIONS[shape_name]
+    spawn_col = BOARD_WIDTH // 2 - states[0].width // 2
+    if not fits(rows, states[0].masks, row, spawn_col):
+        return ()
+
+    tops, holes = surface(rows)
+    spans = COLUMN_SPANS[shape_name]
+    results = []
+
+    def add(rotation, state, col, rest):
+        after, lines = place(rows, state.masks, rest, col)
+        # A piece resting on the surface only changes the tops of its
+        # own columns and the holes under it, so the score is updated
+        # from the surface instead of scanning the new board
+        new_tops = None
+        if not lines:
+            new_tops = tops[:]
+            new_holes = holes
+            for dc, top, bottom in spans[rotation]:
+                gap = tops[col + dc] - rest - bottom - 1
+                if gap < 0:
+                    new_tops = None  # Tucked under an overhang
+                    break
+                new_tops[col + dc] = rest + top
+                new_holes += gap
+        if new_tops is None:
+            score = evaluate(after, lines)
+        else:
+            score = heuristic(new_tops, new_holes, 0)
+        results.append((rotation, col, after, lines, score))
+
+    locked = False
+    for rotation, state in enumerate(states):
+        masks = state.masks
+        if rotation:
+            if not fits(rows, masks, row, spawn_col):
+                break  # Rotations are applied in order, so stop at a block
+            if fits(rows, masks, row + 1, spawn_col):
+                row += 1
+            else:
+                locked = True
+        if masks in (s.masks for s in states[:rotation]):
+            if locked:
+                break
+            continue  # Same footprint as an earlier rotation
+        if locked:
+            add(rotation, state, spawn_col, row)
+            break
+
+        add(rotation, state, spawn_col,
+            drop_row(rows, tops, state, row, spawn_col))
+        for direction in (-1, 1):
+            col = spawn_col + direction
+            r = row
+            while (0 <= col <= BOARD_WIDTH - state.width and
+                   fits(rows, masks, r, col)):
+                if not fits(rows, masks, r + 1, col):
+                    add(rotation, state, col, r)
+                    break
+                r += 1
+                add(rotation, state, col, drop_row(rows, tops, state, r, col))
+                col += direction
+    return tuple(results)
+
+
+def heuristic(tops, holes, lines):
+    """
+    Score a board from its column tops and holes with the aggregate
+    height, holes and bumpiness heuristics, plus the lines cleared.
+    """
+    heights = [BOARD_HEIGHT - top for top in tops]
+    bumpiness = sum(map(abs, map(sub, heights, heights[1:])))
+    return (
+        HEIGHT_WEIGHT * sum(heights)
+        + LINES_WEIGHT * lines
+        + HOLES_WEIGHT * holes
+        + BUMPINESS_WEIGHT * bumpiness
+    )
+
+
+def evaluate(rows, lines):
+    """
+    Score a board with the aggregate height, holes and bumpiness
+    heuristics, plus the number of lines cleared to reach it.
+    """
+    return heuristic(*surface(rows), lines)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def best_placement(rows, shape_name, next_name=None, row=0):
+    """
+    Choose the best (rotation, col) for a piece at row, in its spawn
+    column and rotation, on a board given as a tuple of row masks.
+    With next_name, the best few placements are expanded with every
+    placement of the next piece, from its spawn position.
+    Returns None when the piece has no legal placement.
+    """
+    candidates = sorted(
+        (
+            (score, lines, rotation, col, after)
+            for rotation, col, after, lines, score in placements(
+                rows, shape_name, row
+            )
+        ),
+        key=lambda c: c[0],
+        reverse=True
+    )
+    if not candidates:
+        return None
+    if next_name is None:
+        return candidates[0][2], candidates[0][3]
+
+    best = None
+    best_score = None
+    for score, lines, rotation, col, after in candidates[:BEAM_WIDTH]:
+        follow_ups = placements(after, next_name)
+        if follow_ups:
+            # The follow-up scores count only the next piece's lines
+            score = LINES_WEIGHT * lines + max(
+                score2 for *_, score2 in follow_ups
+            )
+        if best_score is None or score > best_score:
+            best, best_score = (rotation, col), score
+    return best
+
+
+class BotPlayer:
+    """
+    Synthetic player for the game engine. Plans a target placement when
+    a new piece spawns and returns one action per call to reach it,
+    hard dropping the piece once it is lined up.
+    """
+    def __init__(self, lookahead=True):
+        self.lookahead = lookahead
+        self.piece = None
+        self.target = None
+
+    def __call__(self, state):
+        piece = state.current_piece
+        if piece is not self.piece:
+            self.piece = piece
+            next_name = (
+                state.next_piece.shape_name if self.lookahead else None
+            )
+            self.target = best_placement(
+                tuple(state.board.rows), piece.shape_name, next_name,
+                piece.row
+            )
+        if self.target is None:
+            return DOWN
+
+        rotation, col = self.target
+        if piece.rotation != rotation:
+            return ROTATE
+        if piece.col > col:
+            return LEFT
+        if piece.col < col:
+            return RIGHT
+        return HARD_DROP
@@ -0,0 +1,208 @@
+import gc
+import random
+import sys
+from board import Board, EMPTY_ROW, COLOR_INDEX
+from engine import GameState
+from piece import Piece, new_random_piece
+from replay import ReplayError, encode_varint, decode_varint
+from constants import BOARD_WIDTH, BOARD_HEIGHT, PALETTE, TETROMINOES
+
+
+# Memory budget for one game's state, as measured by state_size(). The
+# seeded Mersenne Twister RNG is about 2.5 KiB of it; keeping it means
+# replays and self-play results stay reproducible from their seeds.
+STATE_BUDGET = 6 * 1024
+# Size budget for one serialized checkpoint
+CHECKPOINT_BUDGET = 256
+# Memory budget for one server session while a game is played, as
+# measured by session_size(): everything the session holds beyond the
+# modules shared by every session in the process
+SESSION_BUDGET = 64 * 1024
+
+# A checkpoint is MAGIC, then varints: the seed, ticks, pieces, score,
+# lines, level and flags; the active piece's shape, colour, rotation,
+# row and column; the next piece's shape and colour; and the bitmask
+# of each board row. The palette index of each occupied cell follows,
+# top to bottom, two cells to a byte.
+MAGIC = b"TTS1"
+SHAPES = list(TETROMINOES)
+GAME_OVER = 1
+QUIT_REQUESTED = 2
+
+
+class CheckpointError(Exception):
+    """ Raised when checkpoint data is malformed or can't be made. """
+
+
+def zigzag(value):
+    """ Map a signed int onto an unsigned one for varint encoding. """
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def unzigzag(value):
+    """ Reverse zigzag(). """
+    return value // 2 if value % 2 == 0 else -(value + 1) // 2
+
+
+def save_state(state):
+    """
+    Serialize a seeded game between ticks. The RNG is stored as the
+    seed alone, since its state follows from the pieces drawn so far.
+    The rows of a line clear still being animated are not kept.
+    """
+    if not isinstance(state.seed, int) or state.seed < 0:
+        raise CheckpointError("Only games with an int seed can be saved")
+    data = bytearray(MAGIC)
+    piece = state.current_piece
+    flags = (GAME_OVER if state.game_over else 0) | (
+        QUIT_REQUESTED if state.quit_requested else 0
+    )
+    for value in (
+        state.seed, state.ticks, state.pieces, state.score, state.lines,
+        state.level, flags,
+        SHAPES.index(piece.shape_name), COLOR_INDEX[piece.emoji],
+        piece.rotation, zigzag(piece.row), zigzag(piece.col),
+        SHAPES.index(state.next_piece.shape_name),
+        COLOR_INDEX[state.next_piece.emoji],
+        *state.board.rows
+    ):
+        encode_varint(value, data)
+
+    cells = [
+        colors[c]
+        for row, colors in zip(state.board.rows, state.board.colors)
+        for c in range(BOARD_WIDTH)
+        if row >> c & 1
+    ]
+    for i in range(0, len(cells), 2):
+        high = cells[i + 1] if i + 1 < len(cells) else 0
+        data.append(high << 4 | cells[i])
+    return bytes(data)
+
+
+def load_piece(shape, color):
+    """ Create a piece from its checkpointed shape and colour indices. """
+    if shape >= len(SHAPES) or not 0 < color < len(PALETTE):
+        raise CheckpointError("Unknown piece in checkpoint")
+    return Piece(SHAPES[shape], PALETTE[color])
+
+
+def load_state(data):
+    """ Restore a game saved with save_state(). """
+    if data[:len(MAGIC)] != MAGIC:
+        raise CheckpointError("Not a checkpoint")
+    values = []
+    pos = len(MAGIC)
+    try:
+        for _ in range(14 + BOARD_HEIGHT):
+            value, pos = decode_varint(data, pos)
+            values.append(value)
+    except ReplayError:
+        raise CheckpointError("Truncated checkpoint")
+    seed, ticks, pieces, score, lines, level, flags = values[:7]
+    shape, color, rotation, row, col, next_shape, next_color = values[7:14]
+    rows = values[14:]
+    if rotation > 3 or any(mask >> BOARD_WIDTH for mask in rows):
+        raise CheckpointError("Invalid checkpoint")
+
+    state = GameState(seed)
+    # Draw the same pieces again to bring the RNG up to date
+    state.rng = random.Random(seed)
+    for _ in range(pieces + 2):
+        new_random_piece(state.rng)
+    state.ticks = ticks
+    state.pieces = pieces
+    state.score = score
+    state.lines = lines
+    state.level = level
+    state.game_over = bool(flags & GAME_OVER)
+    state.quit_requested = bool(flags & QUIT_REQUESTED)
+    state.current_piece = load_piece(shape, color)
+    state.current_piece.rotation = rotation
+    state.current_piece.row = unzigzag(row)
+    state.current_piece.col = unzigzag(col)
+    state.next_piece = load_piece(next_shape, next_color)
+
+    packed = data[pos:]
+    occupied = sum(mask.bit_count() for mask in rows)
+    if len(packed) != (occupied + 1) // 2:
+        raise CheckpointError("Checkpoint board colours don't match")
+    cells = iter(
+        byte >> shift & 0xF for byte in packed for shift in (0, 4)
+    )
+    colors = []
+    for mask in rows:
+        if not mask:
+            colors.append(EMPTY_ROW)
+            continue
+        row_colors = bytearray(BOARD_WIDTH)
+        for c in range(BOARD_WIDTH):
+            if mask >> c & 1:
+                row_colors[c] = next(cells)
+                if not 0 < row_colors[c] < len(PALETTE):
+                    raise CheckpointError("Unknown colour in checkpoint")
+        colors.append(bytes(row_colors))
+    state.board = Board(rows, colors)
+    return state
+
+
+def reachable_size(root, shared):
+    """
+    Return the bytes of memory held by every object reachable from
+    root, skipping (and not following) objects for which shared(obj)
+    is true.
+    """
+    seen = set()
+    pending = [root]
+    total = 0
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if shared(obj):
+            continue
+        total += sys.getsizeof(obj)
+        pending.extend(gc.get_referents(obj))
+    return total
+
+
+def shared_by_games(obj):
+    """ True for objects every game shares, like strings and classes. """
+    return (isinstance(obj, (str, type, bool)) or obj is None or
+            obj is EMPTY_ROW or (type(obj) is int and -5 <= obj <= 256))
+
+
+def state_size(state):
+    """
+    Return the bytes of memory held by one game's state: every object
+    reachable from it, except those shared by all games (strings,
+    cached small ints, classes and the empty row).
+    """
+    return reachable_size(state, shared_by_games)
+
+
+def shared_objects(*roots):
+    """
+    Return every object reachable from the loaded modules and roots,
+    keyed by id. These are shared by all sessions in a process; they
+    are kept alive so their ids aren't reused by a session's objects.
+    """
+    shared = {}
+    pending = [*sys.modules.values(), *roots]
+    while pending:
+        obj = pending.pop()
+        if id(obj) not in shared:
+            shared[id(obj)] = obj
+            pending.extend(gc.get_referents(obj))
+    return shared
+
+
+def session_size(session, shared):
+    """
+    Return the bytes of memory held by one server session: its game,
+    driver, frame compositor and layout, console, key queue and socket
+    buffers. Objects in shared, from shared_objects() taken before the
+    session started, are not counted.
+    """
+    return reachable_size(session, lambda obj: id(obj) in shared)
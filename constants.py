@@ -5,6 +5,28 @@ BOARD_WIDTH = 10
 BOARD_HEIGHT = 20
 EMPTY = "  "
 TICK_RATE = 0.5
+MIN_TICK_RATE = 0.1
+TICK_RATE_STEP = 0.05
+
+# Key repeat handling for held keys: delayed auto shift (DAS) before a
+# held key starts repeating, auto repeat rate (ARR) between repeats, and
+# the longest gap between a terminal's auto-repeat events (usually 25-40
+# ms); key events further apart than that are separate presses
+DAS = 0.1
+ARR = 0.05
+AUTO_REPEAT_GAP = 0.05
+
+# Most gravity steps run at once to catch up after a stall
+MAX_CATCH_UP_TICKS = 5
+
+# Line clear wipe: frames per animation and seconds between frames
+LINE_CLEAR_FRAMES = 5
+LINE_CLEAR_FRAME_TIME = 0.04
+
+# Scoring and level progression
+PIECE_POINTS = 10
+LINE_POINTS = 100
+LINES_PER_LEVEL = 5
 
 TETROMINOES = {
     "I": [
@@ -46,4 +68,27 @@ TETROMINO_EMOJIS = (
         "[green]▓▓[/green]", "[magenta]▓▓[/magenta]", "[cyan]▓▓[/cyan]"]
 )
 
-VALID_KEYS = ("KEY_LEFT", "KEY_RIGHT", "KEY_DOWN", "KEY_UP", "q")
+# Marks where the active piece would land
+GHOST = "[bright_black]░░[/bright_black]"
+
+# Palette index 0 is an empty cell; 1..n map onto TETROMINO_EMOJIS
+PALETTE = [EMPTY] + TETROMINO_EMOJIS
+
+# Actions understood by the game engine
+LEFT = "left"
+RIGHT = "right"
+DOWN = "down"
+ROTATE = "rotate"
+HARD_DROP = "hard_drop"
+QUIT = "quit"
+
+KEY_ACTIONS = {
+    "KEY_LEFT": LEFT,
+    "KEY_RIGHT": RIGHT,
+    "KEY_DOWN": DOWN,
+    "KEY_UP": ROTATE,
+    " ": HARD_DROP,
+    "q": QUIT
+}
+
+VALID_KEYS = tuple(KEY_ACTIONS)
@@ -1,38 +1,188 @@
 const Pty = require('node-pty');
 const fs = require('fs');
+const net = require('net');
+const childProcess = require('child_process');
+
+// With GAME_SERVER_SOCKET set, every player is hosted by one shared
+// "python3 server.py" process listening on that Unix socket, instead
+// of a new "python3 run.py" process per connection.
+const GAME_SERVER_SOCKET = process.env.GAME_SERVER_SOCKET;
+// Spectators on /watch are relayed to the server's spectator socket
+const GAME_WATCH_SOCKET = process.env.GAME_WATCH_SOCKET ||
+    (GAME_SERVER_SOCKET && GAME_SERVER_SOCKET + '.watch');
+const CONNECT_RETRIES = 20;
+const CONNECT_RETRY_DELAY = 250;
+
+// Otherwise a few "python3 run.py" processes are started ahead of time
+// and left at the welcome screen, so a new connection gets one that has
+// already done its imports. PTY_POOL_SIZE=0 turns the pool off.
+const PTY_POOL_SIZE = parseInt(process.env.PTY_POOL_SIZE || '2', 10);
+const PTY_RESPAWN_DELAY = 1000;
+const pool = [];
 
 exports.install = function () {
 
     ROUTE('/');
     WEBSOCKET('/', socket, ['raw']);
 
-};
-
-function socket() {
+    if (GAME_SERVER_SOCKET) {
+        ROUTE('/watch', watchView);
+        WEBSOCKET('/watch', watch, ['raw']);
+        startGameServer();
+    } else {
+        fillPool();
+    }
 
-    this.encodedecode = false;
-    this.autodestroy();
+};
 
-    this.on('open', function (client) {
+// Start a game process. Its output is kept until a client takes it.
+function spawnWorker() {
 
-        // Spawn terminal
-        client.tty = Pty.spawn('python3', ['run.py'], {
+    const worker = {
+        tty: Pty.spawn('python3', ['run.py'], {
             name: 'xterm-color',
             cols: 80,
             rows: 24,
             cwd: process.env.PWD,
             env: process.env
-        });
+        }),
+        client: null,
+        output: []
+    };
 
-        client.tty.on('exit', function (code, signal) {
+    worker.tty.on('data', function (data) {
+        if (worker.client) {
+            worker.client.send(data);
+        } else {
+            worker.output.push(data);
+        }
+    });
+
+    worker.tty.on('exit', function (code, signal) {
+        const client = worker.client;
+        if (!client) {
+            // Died while waiting in the pool
+            const index = pool.indexOf(worker);
+            if (index !== -1) {
+                pool.splice(index, 1);
+                setTimeout(fillPool, PTY_RESPAWN_DELAY);
+            }
+            return;
+        }
+        if (client.tty === worker.tty) {
             client.tty = null;
             client.close();
             console.log("Process killed");
-        });
+        }
+    });
+
+    return worker;
+}
+
+// Top the pool up to PTY_POOL_SIZE waiting processes.
+function fillPool() {
+    while (pool.length < PTY_POOL_SIZE) {
+        pool.push(spawnWorker());
+    }
+}
+
+// Hand a client a waiting process, or a new one if none is left,
+// replaying the welcome screen it has drawn so far.
+function takeWorker(client) {
+
+    const worker = pool.shift() || spawnWorker();
+    if (PTY_POOL_SIZE > 0) {
+        setImmediate(fillPool);
+    }
+
+    worker.client = client;
+    if (worker.output.length) {
+        client.send(worker.output.join(''));
+    }
+    worker.output = [];
+    return worker.tty;
+}
+
+function startGameServer() {
+
+    const server = childProcess.spawn(
+        'python3',
+        ['server.py', '--socket', GAME_SERVER_SOCKET,
+            '--watch-socket', GAME_WATCH_SOCKET],
+        { cwd: process.env.PWD, env: process.env, stdio: 'inherit' }
+    );
+
+    server.on('exit', function (code, signal) {
+        console.log("Game server exited (" + (signal || code) + "), restarting");
+        setTimeout(startGameServer, 1000);
+    });
+
+}
+
+// Connect a client to one of the game server's sockets, retrying
+// while it starts up. Returns an object with the same write/kill calls
+// as a pty.
+function connectSession(client, retries, path) {
+
+    const session = {
+        conn: net.createConnection(path),
+        closed: false,
+        write: function (data) {
+            session.conn.write(data);
+        },
+        kill: function () {
+            session.closed = true;
+            session.conn.destroy();
+        }
+    };
+
+    session.conn.setEncoding('utf8');
+
+    session.conn.on('data', function (data) {
+        client.send(data);
+    });
+
+    session.conn.on('error', function (err) {
+        const starting = err.code === 'ENOENT' || err.code === 'ECONNREFUSED';
+        if (starting && retries > 0 && !session.closed) {
+            session.closed = true;
+            setTimeout(function () {
+                if (client.tty === session) {
+                    client.tty = connectSession(client, retries - 1, path);
+                }
+            }, CONNECT_RETRY_DELAY);
+        } else {
+            console.log("Game server connection failed: ", err.message);
+        }
+    });
+
+    session.conn.on('close', function () {
+        if (session.closed || client.tty !== session) {
+            return;
+        }
+        client.tty = null;
+        client.close();
+        console.log("Session ended");
+    });
+
+    return session;
+}
+
+function socket() {
 
-        client.tty.on('data', function (data) {
-            client.send(data);
-        });
+    this.encodedecode = false;
+    this.autodestroy();
+
+    this.on('open', function (client) {
+
+        if (GAME_SERVER_SOCKET) {
+            client.tty = connectSession(
+                client, CONNECT_RETRIES, GAME_SERVER_SOCKET
+            );
+            return;
+        }
+
+        client.tty = takeWorker(client);
 
     });
 
@@ -49,6 +199,34 @@ function socket() {
     });
 }
 
+function watchView() {
+    this.view('index');
+}
+
+// Spectators watch live games on the shared server; their keys only
+// reach the server to stop watching.
+function watch() {
+
+    this.encodedecode = false;
+    this.autodestroy();
+
+    this.on('open', function (client) {
+        client.tty = connectSession(client, CONNECT_RETRIES, GAME_WATCH_SOCKET);
+    });
+
+    this.on('close', function (client) {
+        if (client.tty) {
+            client.tty.kill(9);
+            client.tty = null;
+            console.log("Spectator left");
+        }
+    });
+
+    this.on('message', function (client, msg) {
+        client.tty && client.tty.write(msg);
+    });
+}
+
 if (process.env.CREDS != null) {
     console.log("Creating creds.json file.");
     fs.writeFile('creds.json', process.env.CREDS, 'utf8', function (err) {
@@ -57,4 +235,4 @@ if (process.env.CREDS != null) {
             socket.emit("console_output", "Error saving credentials: " + err);
         }
     });
-}
\ No newline at end of file
+}
@@ -0,0 +1,185 @@
+import random
+from board import (
+    create_board,
+    can_move,
+    drop_distance,
+    lock_piece,
+    find_full_rows,
+    remove_rows
+)
+from piece import new_random_piece
+import metrics
+from constants import (
+    TICK_RATE,
+    MIN_TICK_RATE,
+    TICK_RATE_STEP,
+    PIECE_POINTS,
+    LINE_POINTS,
+    LINES_PER_LEVEL,
+    LEFT,
+    RIGHT,
+    DOWN,
+    ROTATE,
+    HARD_DROP,
+    QUIT
+)
+
+
+class GameState:
+    """
+    Complete state of a single game, independent of any terminal.
+    All randomness comes from a seedable RNG so a game can be
+    reproduced from its seed and the actions applied to it. Slotted,
+    like Piece and Board, so a server can hold thousands of games; see
+    checkpoint.py for the per-game memory budget and serialization.
+    """
+    __slots__ = (
+        "seed", "rng", "board", "score", "level", "lines", "pieces",
+        "ticks", "current_piece", "next_piece", "game_over",
+        "quit_requested", "cleared_rows", "cleared_board"
+    )
+
+    def __init__(self, seed=None):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.board = create_board()
+        self.score = 0
+        self.level = 1
+        self.lines = 0
+        self.pieces = 0
+        self.ticks = 0
+        self.current_piece = new_random_piece(self.rng)
+        self.next_piece = new_random_piece(self.rng)
+        self.game_over = False
+        self.quit_requested = False
+        # Rows cleared by the last lock and the board just before removal,
+        # so a front end can animate them
+        self.cleared_rows = []
+        self.cleared_board = None
+
+    def copy(self):
+        """ Return an independent copy of the game, RNG included. """
+        state = GameState.__new__(GameState)
+        for name in GameState.__slots__:
+            setattr(state, name, getattr(self, name))
+        state.rng = random.Random()
+        state.rng.setstate(self.rng.getstate())
+        state.board = self.board.copy()
+        state.current_piece = self.current_piece.copy()
+        state.next_piece = self.next_piece.copy()
+        state.cleared_rows = list(self.cleared_rows)
+        if self.cleared_board is not None:
+            state.cleared_board = self.cleared_board.copy()
+        return state
+
+    @property
+    def tick_rate(self):
+        """ Seconds between gravity steps at the current level. """
+        return max(
+            MIN_TICK_RATE, TICK_RATE - (self.level - 1) * TICK_RATE_STEP
+        )
+
+    @property
+    def finished(self):
+        """ True once the game has ended by game over or quitting. """
+        return self.game_over or self.quit_requested
+
+
+def apply_action(state, action):
+    """
+    Apply a single player action to the active piece. A hard drop
+    moves the piece straight down and locks it at once.
+    Returns True if the action changed the game state.
+    """
+    state.cleared_rows = []
+    state.cleared_board = None
+    piece = state.current_piece
+    board = state.board
+
+    if action == LEFT and can_move(piece, board, dr=0, dc=-1):
+        piece.col -= 1
+    elif action == RIGHT and can_move(piece, board, dr=0, dc=1):
+        piece.col += 1
+    elif action == DOWN and can_move(piece, board, dr=1):
+        piece.row += 1
+    elif action == ROTATE:
+        rotation = piece.rotation
+        piece.rotate(board)
+        return piece.rotation != rotation
+    elif action == HARD_DROP:
+        piece.row += drop_distance(piece, board)
+        lock_active_piece(state)
+    elif action == QUIT:
+        state.quit_requested = True
+    else:
+        return False
+    return True
+
+
+def apply_gravity(state):
+    """
+    Move the active piece down one row, or lock it and spawn the next
+    piece when it cannot fall any further.
+    """
+    state.ticks += 1
+    state.cleared_rows = []
+    state.cleared_board = None
+    piece = state.current_piece
+    board = state.board
+
+    if can_move(piece, board, dr=1):
+        piece.row += 1
+        return
+
+    lock_active_piece(state)
+
+
+def lock_active_piece(state):
+    """
+    Lock the active piece where it is, clear the lines it completed
+    and spawn the next piece. Handles scoring, level progression and
+    game over.
+    """
+    piece = state.current_piece
+    board = state.board
+    lock_piece(piece, board)
+    state.pieces += 1
+    state.score += PIECE_POINTS
+
+    with metrics.phase("clear_lines"):
+        # Only the rows the piece was locked into can have filled up
+        full_rows = find_full_rows(
+            board, range(piece.row, piece.row + len(piece.masks))
+        )
+        if full_rows:
+            state.cleared_rows = full_rows
+            state.cleared_board = board.copy()
+            remove_rows(board, full_rows)
+        state.score += len(full_rows) * LINE_POINTS
+        state.lines += len(full_rows)
+
+    if state.lines >= state.level * LINES_PER_LEVEL:
+        state.level += 1
+
+    state.current_piece = state.next_piece
+    state.next_piece = new_random_piece(state.rng)
+
+    if not can_move(state.current_piece, board, dr=0):
+        state.game_over = True
+
+
+def step(state, action=None):
+    """
+    Advance the game by one tick: apply the action (if any),
+    then gravity. A hard drop locks the piece, so it takes the place
+    of gravity and its cleared_rows are kept for the caller. Does
+    nothing once the game has finished.
+    """
+    if state.finished:
+        return state
+    apply_action(state, action)
+    if action == HARD_DROP:
+        state.ticks += 1
+    elif not state.finished:
+        apply_gravity(state)
+    return state
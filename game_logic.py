@@ -1,38 +1,53 @@
+import random
 import time
 import sys
-from prompt_toolkit import prompt
-from prompt_toolkit.validation import Validator, ValidationError
-from prompt_toolkit.document import Document
 from rich.live import Live
-from rich.layout import Layout
-from rich.panel import Panel
-from board import (
-    create_board,
-    can_move,
-    lock_piece,
-    add_piece_to_board,
-    clear_lines
-)
-from piece import new_random_piece
+from engine import GameState, apply_action, apply_gravity
+from input_pump import InputPump
+from ansi_renderer import PlayfieldRenderer, USE_ANSI_RENDERER
+from replay import ReplayRecorder, REPLAY_DIR
 from user_interface import (
-    render_board, render_next_panel, render_score_panel,
-    render_controls_panel, console, term
+    FrameCompositor,
+    LineClearAnimation,
+    render_rank,
+    render_full_leaderboard_panel,
+    render_game_over_panel,
+    render_score_saved_panel,
+    console,
+    term
 )
-from highscores import get_high_scores, submit_score
-from constants import VALID_KEYS
+from highscores import get_high_scores, get_rank, submit_score
+import metrics
+from constants import MAX_CATCH_UP_TICKS
 
 
-class MaxLengthValidator(Validator):
+def prompt_name():
     """
-    Validator to ensure the input length does
-    not exceed 10 characters.
+    Prompt for a leaderboard name of at most 10 characters.
+    prompt_toolkit is only imported here, the first time a score is
+    saved, as it is slow to import and not needed to play.
     """
-    def validate(self, document: Document):
-        if len(document.text) > 10:
-            raise ValidationError(
-                message="Maximum 10 characters allowed.",
-                cursor_position=10
-            )
+    with metrics.phase("import_prompt_toolkit"):
+        from prompt_toolkit import prompt
+        from prompt_toolkit.validation import Validator, ValidationError
+
+    class MaxLengthValidator(Validator):
+        """
+        Validator to ensure the input length does
+        not exceed 10 characters.
+        """
+        def validate(self, document):
+            if len(document.text) > 10:
+                raise ValidationError(
+                    message="Maximum 10 characters allowed.",
+                    cursor_position=10
+                )
+
+    return prompt(
+        "> ",
+        validator=MaxLengthValidator(),
+        validate_while_typing=True
+    )
 
 
 def handle_post_game_input():
@@ -54,115 +69,150 @@ def handle_post_game_input():
     return False
 
 
-def run_game_loop():
+class GameDriver:
     """
-    Main game loop that handles Tetris gameplay, user input, rendering,
-    score tracking, level progression, and game over behavior.
-    Returns the final score and whether the user requested to quit.
+    Runs one game for a front end. Input is applied as soon as it
+    arrives, while gravity runs on a fixed timestep and line clears
+    play as a non-blocking animation. The front end waits for input
+    until deadline() and passes in the Live display to draw on.
+    Every game is recorded as a replay of its seed and the actions
+    applied. On a terminal console of at least 80x24, the board is
+    drawn by the ANSI playfield renderer unless TETRIS_RENDERER=rich.
     """
-    board = create_board()
-    score = 0
-    level = 1
-    lines_total = 0
-    tick_rate = 0.5
-    current_piece = new_random_piece()
-    next_piece = new_random_piece()
-    quit_requested = False
-    high_scores_text = get_high_scores()
-
-    with term.cbreak(), Live(console=console, refresh_per_second=10) as live:
-        while True:
-            start_time = time.time()
-            key = None
-
-            while time.time() - start_time < tick_rate:
-                k = term.inkey(timeout=0.01)
-                if not k:
-                    continue
-                key_name = k.name if hasattr(k, "name") else None
-                key_str = str(k).lower()
-                if key_name in VALID_KEYS or key_str == "q":
-                    key = k
-                    break
+    __slots__ = (
+        "state", "recorder", "compositor", "high_scores_text", "animation",
+        "pending_clear", "next_tick"
+    )
+
+    def __init__(self, high_scores_text, seed=None, console=console):
+        if seed is None:
+            seed = random.randrange(1 << 32)
+        self.state = GameState(seed)
+        self.recorder = ReplayRecorder(seed)
+        playfield = None
+        if USE_ANSI_RENDERER and console.is_terminal:
+            playfield = PlayfieldRenderer(console)
+        self.compositor = FrameCompositor(playfield)
+        self.high_scores_text = high_scores_text
+        self.animation = None
+        self.pending_clear = None
+        self.next_tick = 0.0
+
+    def start(self, live, now):
+        """ Draw the first frame and schedule the first gravity step. """
+        self.compositor.draw_state(live, self.state, self.high_scores_text)
+        self.next_tick = now + self.state.tick_rate
+
+    def deadline(self):
+        """ Return the time the next gravity step or frame is due. """
+        if self.animation:
+            return min(self.next_tick, self.animation.next_frame)
+        return self.next_tick
+
+    def apply_actions(self, actions):
+        """ Apply player actions in order, stopping once the game ends. """
+        state = self.state
+        for action in actions:
+            with metrics.phase("update"):
+                apply_action(state, action)
+            self.recorder.record(state.ticks, action)
+            if state.cleared_rows:
+                # Lines cleared by a hard drop are animated on advance()
+                self.pending_clear = (
+                    state.cleared_board.grid(), state.cleared_rows
+                )
+            if state.finished:
+                break
+
+    def start_clear(self, live, now, grid, rows):
+        """ Start the wipe animation for rows cleared from grid. """
+        self.compositor.update_sidebar(
+            self.state.next_piece, self.state.score, self.high_scores_text
+        )
+        self.animation = LineClearAnimation(grid, rows)
+        self.animation.advance(now)
+        self.compositor.show_grid(self.animation.board)
+        self.compositor.refresh(live)
+
+    def advance(self, live, now):
+        """
+        Play due animation frames and gravity steps, then redraw the
+        frame if anything changed.
+        """
+        state = self.state
+        compositor = self.compositor
+        if state.finished:
+            return
+
+        if self.pending_clear:
+            self.start_clear(live, now, *self.pending_clear)
+            self.pending_clear = None
+        elif self.animation:
+            if self.animation.advance(now):
+                compositor.show_grid(self.animation.board)
+                compositor.refresh(live)
+            elif self.animation.finished(now):
+                self.animation = None
+
+        # Fixed timestep: run every gravity step that is due, but
+        # never more than a few after a stall
+        if now - self.next_tick > MAX_CATCH_UP_TICKS * state.tick_rate:
+            metrics.count(
+                "dropped_ticks", int((now - self.next_tick) / state.tick_rate)
+            )
+            self.next_tick = now
+        while now >= self.next_tick and not state.finished:
+            lag = now - self.next_tick
+            metrics.record("tick_lag", lag)
+            if lag > state.tick_rate:
+                metrics.count("late_ticks")
+            self.next_tick += state.tick_rate
+            if self.animation:
+                continue  # Gravity is held while the wipe plays
+            with metrics.phase("update"):
+                apply_gravity(state)
+            metrics.count("ticks")
+            if state.cleared_rows:
+                self.start_clear(
+                    live, now, state.cleared_board.grid(), state.cleared_rows
+                )
 
-            if key:
-                key_name = key.name if hasattr(key, "name") else None
-                key_str = str(key).lower()
+        if not self.animation and not state.finished:
+            compositor.draw_state(live, state, self.high_scores_text)
 
-                if key_name == "KEY_LEFT" and can_move(
-                                                        current_piece,
-                                                        board,
-                                                        dr=0,
-                                                        dc=-1
-                                                    ):
-                    current_piece.col -= 1
-                elif key_name == "KEY_RIGHT" and can_move(
-                                                        current_piece,
-                                                        board,
-                                                        dr=0,
-                                                        dc=1
-                                                        ):
-                    current_piece.col += 1
-                elif key_name == "KEY_DOWN" and can_move(
-                                                        current_piece,
-                                                        board,
-                                                        dr=1
-                                                        ):
-                    current_piece.row += 1
-                elif key_name == "KEY_UP":
-                    current_piece.rotate(board)
-                elif key_str == "q":
-                    quit_requested = True
-                    break
+    def finish(self, directory=REPLAY_DIR):
+        """
+        Save the game's replay to directory, unless it is empty and
+        replays are turned off.
+        """
+        self.recorder.finish(self.state.ticks)
+        if directory:
+            try:
+                self.recorder.save(directory)
+            except OSError:
+                pass  # A missing replay should not interrupt the game over
 
-            if can_move(current_piece, board, dr=1):
-                current_piece.row += 1
-            else:
-                lock_piece(current_piece, board)
-                score += 10
-                board, lines = clear_lines(
-                    board, live, score, next_piece, high_scores_text
-                )
-                score += lines * 100
-                lines_total += lines
-
-                if lines_total >= level * 5:
-                    level += 1
-                tick_rate = max(0.1, 0.5 - (level - 1) * 0.05)
-
-                current_piece = next_piece
-                next_piece = new_random_piece()
-
-                if not can_move(current_piece, board, dr=0):
-                    break
-
-            temp_board = add_piece_to_board(current_piece, board)
-            layout = Layout()
-            layout.split_row(
-                Layout(
-                    Panel(
-                        render_board(temp_board),
-                        title="TETRIS",
-                        border_style="bold red",
-                        width=24
-                        ),
-                    name="game",
-                    size=24
-                ),
-                Layout(name="sidebar", size=28),
-                Layout(
-                    Panel(high_scores_text, title="LEADERBOARD", width=24),
-                    name="leaderboard"
-                )
-            )
-            layout["sidebar"].split_column(
-                Layout(render_next_panel(next_piece)),
-                Layout(render_score_panel(score)),
-                Layout(render_controls_panel())
-            )
-            live.update(Panel(layout, height=24, width=80, border_style="dim"))
 
-    return score, quit_requested
+def run_game_loop():
+    """
+    Terminal driver for the game. Between gravity steps the loop
+    sleeps on the terminal instead of polling.
+    Returns the final score and whether the user requested to quit.
+    """
+    driver = GameDriver(get_high_scores())
+    state = driver.state
+    pump = InputPump(term)
+
+    with term.cbreak(), Live(console=console, auto_refresh=False) as live:
+        driver.start(live, time.monotonic())
+        while not state.finished:
+            with metrics.phase("input_wait"):
+                actions = pump.poll(driver.deadline() - time.monotonic())
+            driver.apply_actions(actions)
+            driver.advance(live, time.monotonic())
+
+    driver.finish()
+    return state.score, state.quit_requested
 
 
 def post_game_prompt(score):
@@ -171,6 +221,7 @@ def post_game_prompt(score):
     score saving or restarting.
     """
     leaderboard_visible = False
+    rank_text = render_rank(score, get_rank(score))
 
     previous_state = None
 
@@ -179,33 +230,19 @@ def post_game_prompt(score):
             console.clear()
             if leaderboard_visible:
                 high_scores_text = get_high_scores(limit=20, two_columns=True)
-                console.print(Panel(
-                    high_scores_text,
-                    title="LEADERBOARD",
-                    border_style="blue",
-                    width=50,
-                    expand=False
-                ), justify="center")
+                console.print(
+                    render_full_leaderboard_panel(high_scores_text),
+                    justify="center"
+                )
                 console.print(
                     "\nPress [bold cyan]L[/bold cyan] to return.",
                     justify="center"
                     )
             else:
-                console.print(Panel(
-                    f"""
-[bold]Score:[/bold] {score}
-
-Would you like to record your score?
-
-Press [bold cyan]Enter[/bold cyan] to save your score to the leaderboard,
-[green]R[/green] to restart, [magenta]Q[/magenta] to quit,
-or [blue]L[/blue] to view leaderboard.
-                    """,
-                    title="GAME OVER",
-                    border_style="red",
-                    width=50,
-                    expand=False
-                ), justify="center")
+                console.print(
+                    render_game_over_panel(score, rank_text),
+                    justify="center"
+                )
             previous_state = leaderboard_visible
 
         with term.cbreak():
@@ -235,11 +272,7 @@ def handle_score_submission(score):
 (max 10 characters, or press [cyan]Enter[/cyan] to skip)
     """, justify="center")
 
-    name = prompt(
-                "> ",
-                validator=MaxLengthValidator(),
-                validate_while_typing=True
-                ).strip()
+    name = prompt_name().strip()
 
     if not name:
         name = "Player"
@@ -254,33 +287,17 @@ def handle_score_submission(score):
             console.clear()
             if leaderboard_visible:
                 high_scores_text = get_high_scores(limit=20, two_columns=True)
-                console.print(Panel(
-                    high_scores_text,
-                    title="LEADERBOARD",
-                    border_style="blue",
-                    width=50,
-                    expand=False
-                ), justify="center")
+                console.print(
+                    render_full_leaderboard_panel(high_scores_text),
+                    justify="center"
+                )
                 console.print(
                     "\nPress [bold cyan]L[/bold cyan] to return.",
                     justify="center"
                     )
             else:
                 console.print(
-                    Panel(
-                        f"""
-[bold]Your score has been recorded![/bold]
-
-[bold]Score:[/bold] {score}
-
-Press [green]R[/green] to restart, [magenta]Q[/magenta] to quit,
-or [blue]L[/blue] to view the leaderboard.
-                        """,
-                        title="GAME OVER",
-                        border_style="red",
-                        width=50,
-                        expand=False
-                    ),
+                    render_score_saved_panel(score),
                     justify="center"
                 )
             previous_state = leaderboard_visible
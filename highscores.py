@@ -1,43 +1,395 @@
-import gspread
-from google.oauth2.service_account import Credentials
+import atexit
+import heapq
+from collections import Counter
+import json
+import os
+import threading
+import time
+try:
+    import fcntl
+except ImportError:
+    # No flock() on Windows: the journal is only locked within a process
+    fcntl = None
+from rich.markup import escape
+from backends import (
+    SheetsBackend,
+    create_backend,
+    score_of
+)
+from score_index import ScoreIndex
+import metrics
 
 
-SCOPE = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive.file",
-    "https://www.googleapis.com/auth/drive"
-    ]
-CREDS = Credentials.from_service_account_file('creds.json')
-SCOPED_CREDS = CREDS.with_scopes(SCOPE)
-GSPREAD_CLIENT = gspread.authorize(SCOPED_CREDS)
-SHEET = GSPREAD_CLIENT.open("leaderboard")
-SCORES_SHEET = SHEET.worksheet("scores")
+CACHE_TTL = 60
+DEFAULT_CACHED_SCORES = 20
+JOURNAL_FILE = "pending_scores.jsonl"
+RETRY_DELAY = 1
+MAX_RETRY_DELAY = 60
+EXIT_FLUSH_TIMEOUT = 3
+OFFLINE_TEXT = "\nLeaderboard\nunavailable."
+# Characters rich reads as markup, removed from submitted names
+MARKUP_CHARS = str.maketrans("", "", "[]\\")
+
+
+class FileLock:
+    """
+    Exclusive flock() on a lock file, shared by every process using the
+    same journal. Threads are serialized as well, since each acquire
+    opens the file again.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def acquire(self, blocking=True):
+        """ Take the lock. Returns False if not blocking and it's held. """
+        f = open(self.path, "a")
+        if fcntl:
+            flags = fcntl.LOCK_EX
+            if not blocking:
+                flags |= fcntl.LOCK_NB
+            try:
+                fcntl.flock(f, flags)
+            except BlockingIOError:
+                f.close()
+                return False
+        self.file = f
+        return True
+
+    def release(self):
+        """ Release the lock by closing the lock file. """
+        self.file.close()
+        self.file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class ScoreSubmitter:
+    """
+    Write-behind queue for score submissions. Scores are appended to a
+    local journal file first, so the UI returns immediately and nothing
+    is lost if the backend fails. A background worker sends all
+    pending scores to the backend in one batch, retrying with exponential
+    backoff, and removes them from the journal once they are saved.
+
+    Every game process shares the journal. Appends and rewrites hold
+    a file lock, and only one process flushes at a time, so rows are
+    neither sent twice nor lost when processes write concurrently.
+    """
+    def __init__(self, backend, path=JOURNAL_FILE):
+        self.backend = backend
+        self.path = path
+        self.lock = threading.Lock()
+        self.journal_lock = FileLock(path + ".lock")
+        self.flush_lock = FileLock(path + ".flush")
+        self.wakeup = threading.Event()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.thread = None
+
+    def pending(self):
+        """ Return the journaled rows that are not yet saved. """
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def submit(self, name, score):
+        """ Journal a score and wake the worker to send it. """
+        with self.lock, self.journal_lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps([name, score]) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        self.start()
+
+    def start(self):
+        """ Start the worker if needed and wake it up. """
+        with self.lock:
+            self.idle.clear()
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+
+    def flush(self):
+        """
+        Send every pending score in one batch and drop the sent rows
+        from the journal. Returns the number of rows sent. Returns 0 if
+        another process is flushing; it sends these rows too, since it
+        keeps flushing until the journal is empty.
+        """
+        if not self.flush_lock.acquire(blocking=False):
+            return 0
+        try:
+            with self.lock, self.journal_lock:
+                rows = self.pending()
+            if not rows:
+                return 0
+
+            with metrics.phase("leaderboard_submit"):
+                self.backend.submit_many(rows)
+
+            with self.lock, self.journal_lock:
+                remaining = self.pending()[len(rows):]
+                if remaining:
+                    with open(self.path, "w", encoding="utf-8") as f:
+                        f.writelines(
+                            json.dumps(row) + "\n" for row in remaining
+                        )
+                else:
+                    os.remove(self.path)
+            return len(rows)
+        finally:
+            self.flush_lock.release()
+
+    def run(self):
+        """ Worker loop: flush on every wakeup, backing off on errors. """
+        delay = RETRY_DELAY
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            try:
+                while self.flush():
+                    pass
+                delay = RETRY_DELAY
+                self.idle.set()
+            except Exception:
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+                self.wakeup.set()
+
+    def drain(self, timeout=EXIT_FLUSH_TIMEOUT):
+        """ Wait up to timeout seconds for pending scores to be sent. """
+        if self.thread is not None and self.thread.is_alive():
+            self.idle.wait(timeout)
+
+
+# Leaderboard storage is chosen with LEADERBOARD_BACKEND (sheets, sqlite
+# or file). With a local backend, LEADERBOARD_MIRROR=sheets also copies
+# every submitted score to Google Sheets through the write-behind queue.
+BACKEND = create_backend(os.getenv("LEADERBOARD_BACKEND", "sheets"))
+if BACKEND.remote:
+    MIRROR = None
+    SUBMITTER = ScoreSubmitter(BACKEND)
+elif os.getenv("LEADERBOARD_MIRROR") == "sheets":
+    MIRROR = SheetsBackend()
+    SUBMITTER = ScoreSubmitter(MIRROR)
+else:
+    MIRROR = None
+    SUBMITTER = None
+if SUBMITTER:
+    atexit.register(SUBMITTER.drain)
+
+
+def start_connecting():
+    """
+    Begin connecting to the leaderboard in the background, and resume
+    sending any scores left in the journal by an earlier session.
+    """
+    BACKEND.start()
+    if MIRROR:
+        MIRROR.start()
+    if SUBMITTER and SUBMITTER.pending():
+        SUBMITTER.start()
+
+
+class LeaderboardCache:
+    """
+    Read-through cache of the top leaderboard entries.
+
+    The first read fetches synchronously. After that, reads are served
+    from memory; once the entries are older than the TTL, a background
+    thread refreshes them while the stale entries keep being served.
+    Formatted leaderboard text is memoized per (limit, two_columns).
+    """
+    def __init__(self, fetch, ttl=CACHE_TTL, size=DEFAULT_CACHED_SCORES):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.size = size
+        self.top = None
+        self.fetched_at = 0.0
+        self.refreshing = False
+        self.texts = {}
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        """ Fetch the top entries from the backend. """
+        try:
+            with metrics.phase("leaderboard_fetch"):
+                top = self.fetch(self.size)
+            with self.lock:
+                self.top = top
+                self.fetched_at = time.monotonic()
+                self.texts.clear()
+        finally:
+            self.refreshing = False
+
+    def get_top(self, limit):
+        """ Return the top entries, highest score first. """
+        with self.lock:
+            if limit > self.size:
+                self.size = limit
+                self.top = None
+            if self.top is None:
+                need_fetch = True
+            else:
+                need_fetch = False
+                stale = time.monotonic() - self.fetched_at > self.ttl
+                if stale and not self.refreshing:
+                    self.refreshing = True
+                    threading.Thread(
+                        target=self.refresh_quietly, daemon=True
+                    ).start()
+
+        if need_fetch:
+            self.refresh()
+        return self.top[:limit]
+
+    def refresh_quietly(self):
+        """ Background refresh that keeps the stale entries on failure. """
+        try:
+            self.refresh()
+        except Exception:
+            pass
+
+    def text(self, limit, two_columns):
+        """ Return the formatted leaderboard text, memoized. """
+        top = self.get_top(limit)
+        key = (limit, two_columns)
+        with self.lock:
+            if key not in self.texts:
+                self.texts[key] = format_high_scores(top, limit, two_columns)
+            return self.texts[key]
+
+    def add(self, name, score):
+        """ Insert a newly submitted score into the cached entries. """
+        with self.lock:
+            if self.top is None:
+                return
+            entries = self.top + [{"Name": name, "Score": score}]
+            self.top = heapq.nlargest(self.size, entries, key=score_of)
+            self.texts.clear()
+
+
+class RankCache:
+    """
+    Keeps a ScoreIndex of every score on the leaderboard. The index is
+    built from every record on first use. After that, only the records
+    stored since the last read are fetched, in the background once the
+    index is older than the TTL. Scores submitted by this process are
+    added straight away and skipped when the backend returns them.
+    """
+    def __init__(self, backend, ttl=CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.index = None
+        self.cursor = None
+        self.local = Counter()
+        self.built_at = 0.0
+        self.refreshing = False
+        self.lock = threading.Lock()
+        self.fetch_lock = threading.Lock()
+
+    def refresh(self):
+        """ Add the records stored since the last refresh to the index. """
+        try:
+            with self.fetch_lock:
+                with metrics.phase("rank_fetch"):
+                    records, cursor = self.backend.records_since(self.cursor)
+                with self.lock:
+                    if self.index is None:
+                        self.index = ScoreIndex()
+                    for record in records:
+                        key = (record.get("Name", "Anon"), score_of(record))
+                        if self.local[key]:
+                            self.local[key] -= 1
+                        else:
+                            self.index.add(*key)
+                    self.cursor = cursor
+                    self.built_at = time.monotonic()
+        finally:
+            self.refreshing = False
+
+    def refresh_quietly(self):
+        """ Background refresh that keeps the current index on failure. """
+        try:
+            self.refresh()
+        except Exception:
+            pass
+
+    def get_index(self):
+        """ Return the current index, building it on first use. """
+        with self.lock:
+            index = self.index
+            stale = time.monotonic() - self.built_at > self.ttl
+            if index is not None and stale and not self.refreshing:
+                self.refreshing = True
+                threading.Thread(
+                    target=self.refresh_quietly, daemon=True
+                ).start()
+        if index is None:
+            self.refresh()
+        return self.index
+
+    def add(self, name, score):
+        """ Add a newly submitted score to the index. """
+        with self.lock:
+            if self.index is not None:
+                self.index.add(name, score)
+                self.local[(name, score)] += 1
+
+
+def get_rank(score, radius=2):
+    """
+    Returns where an unsaved score ranks among all saved scores as a
+    dict with rank, players, top percentage and the entries around it,
+    or None when the leaderboard is unavailable or fails.
+    """
+    try:
+        index = RANKS.get_index()
+    except Exception:
+        return None
+    rank = index.rank(score)
+    players = index.total + 1
+    return {
+        "rank": rank,
+        "players": players,
+        "top_percent": 100.0 * rank / players,
+        "around": index.around(score, radius),
+    }
 
 
 def get_high_scores(limit=10, two_columns=False):
     """
-    Fetches and returns the top high scores from the sheet,
-    sorted in descending order by score.
+    Returns the top high scores, sorted in descending order by score,
+    from the leaderboard cache.
     If two_columns=True, returns the entries formatted in two columns.
+    Returns a placeholder text when the leaderboard is unavailable or
+    fails, e.g. on an API error or timeout.
     """
-    records = SCORES_SHEET.get_all_records()
-    sorted_scores = sorted(
-        records,
-        key=lambda r: (
-            int(r.get("Score", 0))
-            if str(r.get("Score", "")).isdigit()
-            else 0
-        ),
-        reverse=True
-    )
-    top_scores = sorted_scores[:limit]
+    try:
+        return LEADERBOARD.text(limit, two_columns)
+    except Exception:
+        return OFFLINE_TEXT
 
+
+def format_high_scores(top_scores, limit, two_columns):
+    """
+    Format high score entries as leaderboard text,
+    in one or two columns.
+    """
     if not two_columns:
         lines = [""]
         for i, entry in enumerate(top_scores, 1):
-            name = entry.get("Name", "Anon")
+            name = escape(f"{entry.get('Name', 'Anon'):<10}")
             score = entry.get("Score", 0)
-            lines.append(f"{i}. {name:<10} {score}")
+            lines.append(f"{i}. {name} {score}")
             lines.append("")
         return "\n".join(lines)
 
@@ -59,13 +411,27 @@ def get_high_scores(limit=10, two_columns=False):
             f"{right.get('Name', 'Anon'):<10} "
             f"{right.get('Score', 0)}"
         )
-        lines.append(f"{left_text:<25} {right_text}")
+        lines.append(escape(f"{left_text:<25} {right_text}"))
     return "\n".join(lines)
 
 
 def submit_score(name, score):
-    """ Adds a new row to the Scores sheet. """
+    """
+    Records a new score and shows it on the cached leaderboard right
+    away. Remote backends are written in the background. Markup
+    characters are removed from the name.
+    """
+    name = name.translate(MARKUP_CHARS).strip() or "Player"
     try:
-        SCORES_SHEET.append_row([name, int(score)])
+        if not BACKEND.remote:
+            BACKEND.submit(name, int(score))
+        if SUBMITTER:
+            SUBMITTER.submit(name, int(score))
+        LEADERBOARD.add(name, int(score))
+        RANKS.add(name, int(score))
     except Exception as e:
         print(f"Error submitting score: {e}")
+
+
+LEADERBOARD = LeaderboardCache(BACKEND.top)
+RANKS = RankCache(BACKEND)
@@ -0,0 +1,106 @@
+import time
+from constants import (
+    KEY_ACTIONS,
+    DAS,
+    ARR,
+    AUTO_REPEAT_GAP,
+    LEFT,
+    RIGHT,
+    DOWN
+)
+
+
+# Actions that auto-repeat while their key is held
+REPEATABLE_ACTIONS = (LEFT, RIGHT, DOWN)
+
+
+class KeyRepeat:
+    """
+    DAS/ARR filter for held keys. Terminals send no key-up events, only
+    the operating system's auto-repeat, so a key counts as held while
+    its events keep arriving at the auto-repeat cadence, no more than
+    repeat_gap apart. Slower events are taps and always pass.
+    """
+    def __init__(self, das=DAS, arr=ARR, repeat_gap=AUTO_REPEAT_GAP):
+        self.das = das
+        self.arr = arr
+        self.repeat_gap = repeat_gap
+        self.action = None
+        self.pressed_at = 0.0
+        self.last_seen = 0.0
+        self.last_fired = 0.0
+
+    def accept(self, action, now, queued=False):
+        """
+        Return True if this key event should be applied. Queued events
+        were read together with an earlier key, so their arrival times
+        are unknown; they are always applied.
+        """
+        if action not in REPEATABLE_ACTIONS:
+            self.action = None
+            return True
+
+        held = (
+            action == self.action and now - self.last_seen <= self.repeat_gap
+        )
+        self.last_seen = now
+        if not held:
+            self.action = action
+            self.pressed_at = now
+        if queued or not held:
+            self.last_fired = now
+            return True
+
+        if now - self.pressed_at < self.das:
+            return False
+        if now - self.last_fired < self.arr:
+            return False
+        self.last_fired = now
+        return True
+
+    def actions(self, keys):
+        """
+        Filter keys drained together from the input, in order.
+        Returns the list of game actions to apply.
+        """
+        actions = []
+        now = time.monotonic()
+        for index, key in enumerate(keys):
+            action = key_action(key)
+            if action and self.accept(action, now, queued=index > 0):
+                actions.append(action)
+        return actions
+
+
+class InputPump:
+    """
+    Event-driven keyboard input. Blocks on the terminal until a key
+    arrives or the timeout expires, then drains every pending key so
+    no input is lost between ticks.
+    """
+    def __init__(self, term, repeat=None):
+        self.term = term
+        self.repeat = repeat or KeyRepeat()
+
+    def poll(self, timeout):
+        """
+        Wait up to timeout seconds for input.
+        Returns the list of game actions received, in order.
+        """
+        keys = []
+        key = self.term.inkey(timeout=max(0.0, timeout))
+        while key:
+            keys.append(key)
+            key = self.term.inkey(timeout=0)
+        return self.repeat.actions(keys)
+
+
+def key_action(key):
+    """
+    Map a blessed keystroke, or a key name or character, to a game
+    action. Returns None for keys the game doesn't use.
+    """
+    key_name = getattr(key, "name", None) or str(key)
+    if key_name in KEY_ACTIONS:
+        return KEY_ACTIONS[key_name]
+    return KEY_ACTIONS.get(str(key).lower())
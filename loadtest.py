@@ -0,0 +1,456 @@
+import argparse
+import asyncio
+import fcntl
+import json
+import os
+import random
+import statistics
+import struct
+import sys
+import tempfile
+import termios
+import time
+from selfplay import percentile
+
+
+# Sessions run the real game, either as one "python3 run.py" per pty
+# (what controllers/default.js spawns per websocket) or as connections
+# to a shared "python3 server.py" (its GAME_SERVER_SOCKET mode). Both
+# see exactly the bytes the Node front end relays.
+HERE = os.path.dirname(os.path.abspath(__file__))
+RUN_SCRIPT = os.path.join(HERE, "run.py")
+SERVER_SCRIPT = os.path.join(HERE, "server.py")
+SCREEN_ROWS = 24
+SCREEN_COLS = 80
+READ_SIZE = 65536
+
+KEYS = {
+    "left": b"\x1b[D",
+    "right": b"\x1b[C",
+    "down": b"\x1b[B",
+    "rotate": b"\x1b[A",
+    "hard_drop": b" ",
+    "enter": b"\r",
+    "quit": b"q",
+}
+# The keys a scripted session presses in turn; random sessions pick
+# from the same moves
+SCRIPT = ("left", "left", "rotate", "right", "down", "right", "down")
+
+# Text that appears once each screen has been drawn
+WELCOME = b"to begin"
+GAME = b"NEXT"
+GAME_OVER = b"record your score"
+NAME_PROMPT = b"Enter a username"
+SAVED = b"has been recorded"
+GOODBYE = b"Thanks for playing"
+# Cursor position request, answered the way a terminal would
+CURSOR_QUERY = b"\x1b[6n"
+CURSOR_REPLY = b"\x1b[1;1R"
+# Only this much of the output is kept to look for screens in
+MATCH_WINDOW = 8192
+
+DEFAULT_LEVELS = (1, 2, 4, 8, 16)
+DEFAULT_DURATION = 10.0
+KEY_INTERVAL = 0.15
+SCREEN_TIMEOUT = 30.0
+HARD_DROP_INTERVAL = 0.05
+# A level degrades once its p95 key-to-frame latency or time to first
+# frame is this many times that of the first level. Anything within
+# one 60 Hz frame is never counted, as sub-millisecond noise would be.
+DEGRADE_FACTOR = 2.0
+LATENCY_FLOOR_MS = 1000 / 60
+
+
+class SessionFailed(Exception):
+    """ Raised when a session doesn't reach the next screen in time. """
+
+
+class PtyClient:
+    """ One game process on its own pseudo-terminal, like node-pty. """
+    def __init__(self, workdir, env):
+        self.workdir = workdir
+        self.env = env
+        self.master = None
+        self.process = None
+        self.chunks = asyncio.Queue()
+
+    async def start(self):
+        self.master, slave = os.openpty()
+        fcntl.ioctl(self.master, termios.TIOCSWINSZ,
+                    struct.pack("HHHH", SCREEN_ROWS, SCREEN_COLS, 0, 0))
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, RUN_SCRIPT,
+            stdin=slave, stdout=slave, stderr=slave,
+            cwd=self.workdir, env=self.env, start_new_session=True
+        )
+        os.close(slave)
+        asyncio.get_running_loop().add_reader(self.master, self.on_readable)
+
+    def on_readable(self):
+        try:
+            data = os.read(self.master, READ_SIZE)
+        except OSError:
+            data = b""  # EIO once the game process has exited
+        if not data:
+            asyncio.get_running_loop().remove_reader(self.master)
+        self.chunks.put_nowait(data)
+
+    async def read(self):
+        return await self.chunks.get()
+
+    def write(self, data):
+        os.write(self.master, data)
+
+    def rss(self):
+        """ Return the game process's resident memory in bytes. """
+        return process_rss(self.process.pid)
+
+    async def close(self):
+        if self.process.returncode is None:
+            self.process.kill()
+        await self.process.wait()
+        asyncio.get_running_loop().remove_reader(self.master)
+        os.close(self.master)
+
+
+class SocketClient:
+    """ One connection to a shared game server. """
+    def __init__(self, path):
+        self.path = path
+        self.reader = None
+        self.writer = None
+
+    async def start(self):
+        self.reader, self.writer = await asyncio.open_unix_connection(
+            self.path
+        )
+
+    async def read(self):
+        try:
+            return await self.reader.read(READ_SIZE)
+        except ConnectionError:
+            return b""
+
+    def write(self, data):
+        self.writer.write(data)
+
+    def rss(self):
+        return None  # Shared by every session; measured on the server
+
+    async def close(self):
+        self.writer.close()
+
+
+def process_rss(pid):
+    """ Return a process's resident set size in bytes, if known. """
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class Session:
+    """
+    Drives one client through a whole visit: welcome screen, a game of
+    scripted or random moves, hard drops until game over, then saving
+    a name to the leaderboard and quitting. Records time to first
+    frame, key-to-frame latencies and bytes received.
+    """
+    def __init__(self, client, number, keys, duration, seed):
+        self.client = client
+        self.number = number
+        self.keys = keys
+        self.duration = duration
+        self.rng = random.Random(seed)
+        self.output = b""
+        self.received = 0
+        self.changed = asyncio.Event()
+        self.closed = False
+        self.key_sent = None
+        self.latencies = []
+        self.first_frame = None
+        self.rss = None
+        self.stage = "connect"
+
+    async def read_output(self):
+        """ Reader task: collect output and time the frames keys cause. """
+        while True:
+            data = await self.client.read()
+            if not data:
+                break
+            if self.key_sent is not None:
+                self.latencies.append(time.monotonic() - self.key_sent)
+                self.key_sent = None
+            self.received += len(data)
+            if CURSOR_QUERY in data:
+                self.client.write(CURSOR_REPLY)
+            self.output = (self.output + data)[-MATCH_WINDOW:]
+            self.changed.set()
+        self.closed = True
+        self.changed.set()
+
+    async def wait_for(self, text, stage, timeout=SCREEN_TIMEOUT):
+        """ Wait until text has been drawn, then forget the output. """
+        self.stage = stage
+        deadline = time.monotonic() + timeout
+        while text not in self.output:
+            if self.closed:
+                raise SessionFailed(f"closed while waiting for {stage}")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise SessionFailed(f"timed out waiting for {stage}")
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        self.output = b""
+
+    def press(self, key, timed=False):
+        """ Send a key; timed keys measure the time to the next frame. """
+        if timed:
+            self.key_sent = time.monotonic()
+        self.client.write(KEYS[key])
+
+    def next_move(self, i):
+        if self.keys == "script":
+            return SCRIPT[i % len(SCRIPT)]
+        return self.rng.choice(SCRIPT)
+
+    async def play(self):
+        """ Press moves for the session's duration, then top out. """
+        end = time.monotonic() + self.duration
+        i = 0
+        while time.monotonic() < end:
+            self.press(self.next_move(i), timed=True)
+            i += 1
+            await asyncio.sleep(KEY_INTERVAL * self.rng.uniform(0.5, 1.5))
+        self.rss = self.client.rss()
+        self.key_sent = None
+
+        self.stage = "game over"
+        deadline = time.monotonic() + SCREEN_TIMEOUT
+        while GAME_OVER not in self.output:
+            if self.closed or time.monotonic() > deadline:
+                raise SessionFailed("never reached game over")
+            self.press("hard_drop")
+            await asyncio.sleep(HARD_DROP_INTERVAL)
+        self.output = b""
+
+    async def run(self):
+        """ Run the visit. Returns the session's result. """
+        start = time.monotonic()
+        error = None
+        reader = None
+        try:
+            await self.client.start()
+            reader = asyncio.create_task(self.read_output())
+            await self.wait_for(WELCOME, "welcome")
+            self.first_frame = time.monotonic() - start
+            self.press("enter")
+            await self.wait_for(GAME, "game")
+            await self.play()
+            self.press("enter")
+            await self.wait_for(NAME_PROMPT, "name prompt")
+            self.client.write(f"load{self.number}".encode("ascii"))
+            self.press("enter")
+            await self.wait_for(SAVED, "score saved")
+            self.press("quit")
+            await self.wait_for(GOODBYE, "goodbye")
+        except (SessionFailed, OSError) as e:
+            error = f"{self.stage}: {e}"
+        finally:
+            await self.client.close()
+            if reader:
+                reader.cancel()
+        return {
+            "first_frame": self.first_frame,
+            "latencies": self.latencies,
+            "bytes": self.received,
+            "rss": self.rss,
+            "error": error,
+        }
+
+
+async def start_server(workdir, env):
+    """ Start a game server in workdir and wait until it listens. """
+    path = os.path.join(workdir, "tetris.sock")
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, SERVER_SCRIPT, "--socket", path,
+        cwd=workdir, env=env, stdout=asyncio.subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + SCREEN_TIMEOUT
+    while not os.path.exists(path):
+        if process.returncode is not None or time.monotonic() > deadline:
+            raise SessionFailed("game server did not start")
+        await asyncio.sleep(0.1)
+    return process, path
+
+
+async def run_level(sessions, args, workdir, env, socket_path=None,
+                    server=None):
+    """ Run one level of concurrent sessions and summarize it. """
+    def client():
+        if args.mode == "socket":
+            return SocketClient(socket_path)
+        return PtyClient(workdir, env)
+
+    server_rss = process_rss(server.pid) if server else None
+    results = await asyncio.gather(*(
+        Session(client(), n, args.keys, args.duration,
+                args.seed * 1000003 + n).run()
+        for n in range(sessions)
+    ))
+    if server:
+        peak = process_rss(server.pid)
+        if peak is not None and server_rss is not None:
+            for result in results:
+                result["rss"] = max(0, peak - server_rss) / sessions
+    return summarize(sessions, results)
+
+
+def summarize(sessions, results):
+    """ Aggregate one level's session results. """
+    ok = [r for r in results if r["error"] is None]
+    first_frames = sorted(
+        r["first_frame"] for r in results if r["first_frame"] is not None
+    )
+    latencies = sorted(t for r in results for t in r["latencies"])
+    rss = [r["rss"] for r in results if r["rss"] is not None]
+    return {
+        "sessions": sessions,
+        "completed": len(ok),
+        "errors": [r["error"] for r in results if r["error"]],
+        "first_frame_ms": {
+            "p50": 1000 * percentile(first_frames, 50),
+            "p95": 1000 * percentile(first_frames, 95),
+        },
+        "key_latency_ms": {
+            "count": len(latencies),
+            "p50": 1000 * percentile(latencies, 50),
+            "p95": 1000 * percentile(latencies, 95),
+            "p99": 1000 * percentile(latencies, 99),
+        },
+        "bytes_per_session": (
+            statistics.fmean(r["bytes"] for r in results) if results else 0
+        ),
+        "rss_mb_per_session": (
+            statistics.fmean(rss) / 2 ** 20 if rss else None
+        ),
+    }
+
+
+def find_degradation(levels, factor=DEGRADE_FACTOR):
+    """
+    Return the first level whose p95 key latency or time to first
+    frame is factor times that of the first level (and over
+    LATENCY_FLOOR_MS), or that had failed sessions. Returns None if
+    every level held up.
+    """
+    base = levels[0]
+    for level in levels:
+        if level["errors"]:
+            return level
+        for metric in ("key_latency_ms", "first_frame_ms"):
+            limit = max(factor * base[metric]["p95"], LATENCY_FLOOR_MS)
+            if level[metric]["p95"] > limit:
+                return level
+    return None
+
+
+async def run_load(args):
+    """ Run every concurrency level in turn. Returns the report. """
+    with tempfile.TemporaryDirectory() as workdir:
+        # The fake leaderboard and the score journal live in workdir,
+        # so a load run never touches Google Sheets
+        env = dict(os.environ, LEADERBOARD_BACKEND="file",
+                   TETRIS_REPLAY_DIR="", TERM="xterm-256color")
+        server = socket_path = None
+        if args.mode == "socket":
+            server, socket_path = await start_server(workdir, env)
+        levels = []
+        try:
+            for sessions in args.levels:
+                level = await run_level(sessions, args, workdir, env,
+                                        socket_path, server)
+                levels.append(level)
+                print_level(level)
+        finally:
+            if server:
+                server.terminate()
+                await server.wait()
+
+    degraded = find_degradation(levels, args.factor)
+    return {
+        "mode": args.mode,
+        "keys": args.keys,
+        "duration": args.duration,
+        "levels": levels,
+        "degrades_at": degraded["sessions"] if degraded else None,
+    }
+
+
+def print_level(level):
+    """ Print one level's row of the report. """
+    rss = level["rss_mb_per_session"]
+    print(
+        f"{level['sessions']:>8} {level['completed']:>9} "
+        f"{level['first_frame_ms']['p50']:>9.0f} "
+        f"{level['first_frame_ms']['p95']:>9.0f} "
+        f"{level['key_latency_ms']['p50']:>8.1f} "
+        f"{level['key_latency_ms']['p95']:>8.1f} "
+        f"{level['key_latency_ms']['p99']:>8.1f} "
+        f"{level['bytes_per_session'] / 1024:>9.1f} "
+        f"{rss if rss is not None else 0:>8.1f}"
+    )
+    for error in level["errors"]:
+        print(f"         error: {error}")
+
+
+def main():
+    """ Command-line entry point for load runs. """
+    parser = argparse.ArgumentParser(
+        description="Drive many concurrent Tetris sessions and report "
+                    "where latency degrades."
+    )
+    parser.add_argument("--mode", choices=("pty", "socket"), default="pty",
+                        help="a run.py process per session, or sessions "
+                             "on one server.py")
+    parser.add_argument("--levels", type=int, nargs="+",
+                        default=list(DEFAULT_LEVELS),
+                        help="numbers of concurrent sessions to try")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION,
+                        help="seconds of play per session")
+    parser.add_argument("--keys", choices=("random", "script"),
+                        default="random")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--factor", type=float, default=DEGRADE_FACTOR,
+                        help="p95 slowdown against the first level that "
+                             "counts as degraded")
+    parser.add_argument("--json", metavar="PATH",
+                        help="write the report as JSON to PATH")
+    args = parser.parse_args()
+
+    print(f"{'sessions':>8} {'completed':>9} {'ttff p50':>9} "
+          f"{'ttff p95':>9} {'key p50':>8} {'key p95':>8} {'key p99':>8} "
+          f"{'KiB/sess':>9} {'MiB/sess':>8}")
+    report = asyncio.run(run_load(args))
+
+    if report["degrades_at"] is None:
+        print(f"\nNo degradation up to {args.levels[-1]} sessions.")
+    else:
+        print(f"\nLatency degrades at {report['degrades_at']} "
+              "concurrent sessions.")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
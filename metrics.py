@@ -0,0 +1,262 @@
+import atexit
+import json
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+
+# Imported first by the entry points, so this is close to process start
+STARTED = time.perf_counter()
+
+
+# Instrumentation is off unless TETRIS_METRICS is set. Its value is the
+# file the session report is appended to ("1" for the default file),
+# or an http(s) URL the report is POSTed to as JSON.
+METRICS_ENV = "TETRIS_METRICS"
+DEFAULT_METRICS_FILE = "metrics.jsonl"
+POST_TIMEOUT = 3
+
+# Latency buckets grow by a factor of 2 ** (1 / 8), about 9%, from one
+# microsecond, so percentiles are accurate to within one bucket
+MIN_LATENCY = 1e-6
+BUCKETS_PER_DOUBLING = 8
+PERCENTILES = (50, 95, 99)
+
+# Module imports faster than this are left out of the report
+MIN_IMPORT_TIME = 0.001
+
+NULL_PHASE = nullcontext()
+
+
+class Histogram:
+    """ Log-bucketed latency histogram with constant-time recording. """
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        """ Add one latency sample, in seconds. """
+        if seconds <= MIN_LATENCY:
+            b = 0
+        else:
+            b = int(math.log2(seconds / MIN_LATENCY) * BUCKETS_PER_DOUBLING)
+            b += 1
+        self.counts[b] = self.counts.get(b, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """ Return the upper bound of the bucket holding percentile p. """
+        if not self.count:
+            return 0.0
+        target = p / 100 * self.count
+        seen = 0
+        for b in sorted(self.counts):
+            seen += self.counts[b]
+            if seen >= target:
+                break
+        return min(MIN_LATENCY * 2 ** (b / BUCKETS_PER_DOUBLING), self.max)
+
+    def summary(self):
+        """ Return count, mean, max and percentiles in milliseconds. """
+        result = {
+            "count": self.count,
+            "mean_ms": 1000 * self.total / self.count if self.count else 0.0,
+            "max_ms": 1000 * self.max,
+        }
+        for p in PERCENTILES:
+            result[f"p{p}_ms"] = 1000 * self.percentile(p)
+        return result
+
+
+class Phase:
+    """ Context manager that records the time spent in a block. """
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class ImportTimer:
+    """
+    Meta path finder that times the import of every module loaded from
+    a file, including the modules it imports in turn, like
+    python -X importtime. It finds nothing itself: it asks the other
+    finders, and wraps the exec_module of the loader they return.
+    """
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is None:
+                continue
+            # File loaders are created per module, so patching one
+            # instance times just this import
+            loader = spec.loader
+            if hasattr(loader, "path") and hasattr(loader, "exec_module"):
+                loader.exec_module = self.timed(name, loader.exec_module)
+            return spec
+        return None
+
+    def timed(self, name, exec_module):
+        """ Wrap a loader's exec_module to record the import's time. """
+        def exec_and_record(module):
+            start = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                self.metrics.record_import(
+                    name, time.perf_counter() - start
+                )
+        return exec_and_record
+
+
+class Metrics:
+    """
+    Collects phase latencies and event counters for one session. When
+    disabled, every call returns immediately without recording.
+    """
+    def __init__(self, enabled=False, destination=DEFAULT_METRICS_FILE):
+        self.enabled = enabled
+        self.destination = destination
+        self.histograms = {}
+        self.counters = {}
+        self.imports = {}
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def phase(self, name):
+        """ Return a context manager timing a block as phase name. """
+        if not self.enabled:
+            return NULL_PHASE
+        return Phase(self, name)
+
+    def record(self, name, seconds):
+        """ Record one latency sample for name. """
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.record(seconds)
+
+    def count(self, name, n=1):
+        """ Add n to the counter name. """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def record_import(self, name, seconds):
+        """ Record how long importing a module took. """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.imports[name] = seconds
+
+    def time_imports(self):
+        """ Start timing every module imported from now on. """
+        if self.enabled:
+            sys.meta_path.insert(0, ImportTimer(self))
+
+    def report(self):
+        """ Return the session report as a JSON-serializable dict. """
+        with self.lock:
+            return {
+                "pid": os.getpid(),
+                "started": self.started,
+                "duration": time.time() - self.started,
+                "counters": dict(self.counters),
+                "phases": {
+                    name: histogram.summary()
+                    for name, histogram in sorted(self.histograms.items())
+                },
+                "imports_ms": {
+                    name: 1000 * seconds
+                    for name, seconds in sorted(
+                        self.imports.items(), key=lambda item: -item[1]
+                    )
+                    if seconds >= MIN_IMPORT_TIME
+                },
+            }
+
+    def dump(self):
+        """
+        Send the session report to its destination: POST it to a stats
+        endpoint, or append it as one line to the metrics file.
+        """
+        if not self.enabled:
+            return
+        data = json.dumps(self.report())
+        try:
+            if self.destination.startswith(("http://", "https://")):
+                import urllib.request  # Only needed for a stats endpoint
+                request = urllib.request.Request(
+                    self.destination,
+                    data=data.encode("utf-8"),
+                    headers={"Content-Type": "application/json"}
+                )
+                urllib.request.urlopen(request, timeout=POST_TIMEOUT).close()
+            else:
+                with open(self.destination, "a", encoding="utf-8") as f:
+                    f.write(data + "\n")
+        except Exception as e:
+            print(f"Error writing metrics: {e}")
+
+
+def from_environment():
+    """ Create the session metrics as configured by TETRIS_METRICS. """
+    setting = os.getenv(METRICS_ENV, "")
+    if not setting or setting == "0":
+        return Metrics()
+    if setting == "1":
+        setting = DEFAULT_METRICS_FILE
+    return Metrics(enabled=True, destination=setting)
+
+
+METRICS = from_environment()
+if METRICS.enabled:
+    METRICS.time_imports()
+    atexit.register(METRICS.dump)
+
+# The metrics of the session running in the current context. server.py
+# gives each session its own, so that its report covers just that
+# session; anywhere else this is the process-wide METRICS.
+CURRENT = ContextVar("metrics")
+
+
+def phase(name):
+    """ Time a block as phase name in the current session's metrics. """
+    return CURRENT.get(METRICS).phase(name)
+
+
+def record(name, seconds):
+    """ Record a latency sample in the current session's metrics. """
+    CURRENT.get(METRICS).record(name, seconds)
+
+
+def count(name, n=1):
+    """ Add n to a counter in the current session's metrics. """
+    CURRENT.get(METRICS).count(name, n)
@@ -1,66 +1,115 @@
 import random
+from collections import namedtuple
 from constants import (
     TETROMINOES,
     TETROMINO_EMOJIS,
-    BOARD_WIDTH,
-    BOARD_HEIGHT,
-    EMPTY
+    BOARD_WIDTH
 )
+from board import shape_fits, shape_masks
+
+
+RotationState = namedtuple(
+    "RotationState",
+    ["shape", "offsets", "masks", "height", "width", "bottoms"]
+)
+
+
+def build_rotation_states(shape):
+    """
+    Precompute all four clockwise rotation states of a shape matrix,
+    with block offsets, row bitmasks and bounding box for each, plus
+    the (column, lowest row) offset of the bottom block in each column.
+    """
+    states = []
+    current = tuple(tuple(row) for row in shape)
+    for _ in range(4):
+        offsets = tuple(
+            (r, c)
+            for r, row in enumerate(current)
+            for c, val in enumerate(row)
+            if val
+        )
+        states.append(RotationState(
+            current,
+            offsets,
+            tuple(shape_masks(current)),
+            len(current),
+            len(current[0]),
+            tuple(
+                (c, max(r for r, oc in offsets if oc == c))
+                for c in range(len(current[0]))
+            )
+        ))
+        current = tuple(zip(*current[::-1]))
+    return tuple(states)
+
+
+ROTATIONS = {
+    name: build_rotation_states(shape) for name, shape in TETROMINOES.items()
+}
 
 
 class Piece:
     """ Represents a Tetromino piece in the game. """
-    def __init__(self, shape_name, shape, emoji):
+    __slots__ = ("shape_name", "emoji", "rotation", "row", "col")
+
+    def __init__(self, shape_name, emoji, rotation=0):
         self.shape_name = shape_name
-        self.shape = shape
         self.emoji = emoji
+        self.rotation = rotation
         self.row = 0
-        self.col = BOARD_WIDTH // 2 - len(shape[0]) // 2
+        self.col = BOARD_WIDTH // 2 - self.state.width // 2
+
+    def copy(self):
+        """ Return an independent copy of the piece. """
+        piece = Piece(self.shape_name, self.emoji, self.rotation)
+        piece.row = self.row
+        piece.col = self.col
+        return piece
+
+    @property
+    def state(self):
+        """ Return the precomputed table entry for the current rotation. """
+        return ROTATIONS[self.shape_name][self.rotation]
+
+    @property
+    def shape(self):
+        """ Return the shape matrix of the current rotation. """
+        return self.state.shape
+
+    @property
+    def masks(self):
+        """ Return the row bitmasks of the current rotation. """
+        return self.state.masks
 
     def get_coords(self):
         """
-        Return a list of (row, col) coordinates for all blocks in the piece
+        Return the (row, col) coordinates for all blocks in the piece
         based on its current position.
         """
-        coords = []
-        for r, row in enumerate(self.shape):
-            for c, val in enumerate(row):
-                if val:
-                    coords.append((self.row + r, self.col + c))
-        return coords
+        row, col = self.row, self.col
+        return tuple((row + r, col + c) for r, c in self.state.offsets)
 
     def rotate(self, board):
         """
         Attempt to rotate the piece clockwise. Only applies
         if no collision occurs.
         """
-        # Rotate shape clockwise
-        rotated = [list(row) for row in zip(*self.shape[::-1])]
-
-        # Get width and height of rotated shape
-        rotated_width = len(rotated[0])
-        rotated_height = len(rotated)
+        rotation = (self.rotation + 1) % 4
+        masks = ROTATIONS[self.shape_name][rotation].masks
 
         # Check if rotation would cause collision or go off-grid
-        for r in range(rotated_height):
-            for c in range(rotated_width):
-                if rotated[r][c]:
-                    board_r = self.row + r
-                    board_c = self.col + c
-                    if (board_r >= BOARD_HEIGHT or
-                        board_c < 0 or
-                        board_c >= BOARD_WIDTH or
-                            board[board_r][board_c] != EMPTY):
-                        return  # Invalid rotation, so cancel
+        if not shape_fits(board, masks, self.row, self.col):
+            return  # Invalid rotation, so cancel
 
-        self.shape = rotated
+        self.rotation = rotation
 
 
-def new_random_piece():
+def new_random_piece(rng=random):
     """
     Generate a new random Tetromino piece with a random shape and color.
+    Pass a seeded random.Random as rng for a reproducible sequence.
     """
-    name = random.choice(list(TETROMINOES.keys()))
-    shape = TETROMINOES[name]
-    block = random.choice(TETROMINO_EMOJIS)
-    return Piece(name, shape, block)
+    name = rng.choice(list(TETROMINOES.keys()))
+    block = rng.choice(TETROMINO_EMOJIS)
+    return Piece(name, block)
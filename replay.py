@@ -0,0 +1,244 @@
+import argparse
+import os
+import sys
+import time
+from engine import GameState, apply_action, apply_gravity
+from constants import (
+    BOARD_WIDTH,
+    BOARD_HEIGHT,
+    LEFT,
+    RIGHT,
+    DOWN,
+    ROTATE,
+    HARD_DROP,
+    QUIT
+)
+
+
+# A replay is MAGIC, the game's seed as a varint, then one varint per
+# event: the ticks since the previous event shifted left by EVENT_BITS,
+# plus the event code. The last event is END, at the tick the game ended.
+MAGIC = b"TTR1"
+EVENT_BITS = 3
+ACTION_CODES = {
+    LEFT: 0, RIGHT: 1, DOWN: 2, ROTATE: 3, QUIT: 4, HARD_DROP: 5
+}
+CODE_ACTIONS = {code: action for action, code in ACTION_CODES.items()}
+END = 7
+
+# Games are only saved when TETRIS_REPLAY_DIR names a directory, so a
+# deployed app doesn't fill its disk with replays
+REPLAY_DIR = os.getenv("TETRIS_REPLAY_DIR", "")
+SNAPSHOT_INTERVAL = 500
+
+
+class ReplayError(Exception):
+    """ Raised when replay data is malformed. """
+
+
+def encode_varint(value, out):
+    """ Append an unsigned int to a bytearray as a LEB128 varint. """
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(data, pos):
+    """ Read a varint at pos. Returns the value and the next position. """
+    value = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise ReplayError("Truncated replay")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class ReplayRecorder:
+    """
+    Records the actions applied to a game, by the gravity tick they
+    were applied at, as a compact replay.
+    """
+    def __init__(self, seed):
+        self.seed = seed
+        self.data = bytearray(MAGIC)
+        encode_varint(seed, self.data)
+        self.last_tick = 0
+        self.finished = False
+
+    def add(self, tick, code):
+        """ Append one event code at a tick. """
+        encode_varint(
+            (tick - self.last_tick) << EVENT_BITS | code, self.data
+        )
+        self.last_tick = tick
+
+    def record(self, tick, action):
+        """ Record an action applied after tick gravity steps. """
+        self.add(tick, ACTION_CODES[action])
+
+    def finish(self, tick):
+        """ Mark the tick the game ended at. """
+        if not self.finished:
+            self.add(tick, END)
+            self.finished = True
+
+    def to_bytes(self):
+        """ Return the encoded replay. """
+        return bytes(self.data)
+
+    def save(self, directory=REPLAY_DIR):
+        """ Write the replay to a new file in directory; returns its path. """
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(
+            directory,
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{self.seed}.replay"
+        )
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+        return path
+
+
+def parse_replay(data):
+    """
+    Decode replay bytes. Returns the seed, a list of (tick, action)
+    events and the tick the game ended at (None if not recorded).
+    """
+    if data[:len(MAGIC)] != MAGIC:
+        raise ReplayError("Not a replay file")
+    seed, pos = decode_varint(data, len(MAGIC))
+    events = []
+    tick = 0
+    while pos < len(data):
+        value, pos = decode_varint(data, pos)
+        tick += value >> EVENT_BITS
+        code = value & ((1 << EVENT_BITS) - 1)
+        if code == END:
+            return seed, events, tick
+        if code not in CODE_ACTIONS:
+            raise ReplayError(f"Unknown event code {code}")
+        events.append((tick, CODE_ACTIONS[code]))
+    return seed, events, None
+
+
+class ReplayPlayer:
+    """
+    Reconstructs a recorded game with the headless engine, without
+    rendering. A snapshot of the game is kept every SNAPSHOT_INTERVAL
+    ticks while playing, so seeking backwards replays from the nearest
+    snapshot instead of from the start.
+    """
+    def __init__(self, data, snapshot_interval=SNAPSHOT_INTERVAL):
+        self.seed, self.events, self.end_tick = parse_replay(data)
+        self.snapshot_interval = snapshot_interval
+        self.snapshots = {}
+        self.state = GameState(self.seed)
+        self.position = 0  # Index of the next event to apply
+
+    def snapshot(self):
+        """ Keep a snapshot if the game is on a snapshot tick. """
+        tick = self.state.ticks
+        if tick % self.snapshot_interval == 0 and tick not in self.snapshots:
+            self.snapshots[tick] = (self.state.copy(), self.position)
+
+    def advance_to(self, tick):
+        """
+        Play forward until tick gravity steps have run, applying
+        every event recorded before that tick's gravity step.
+        """
+        state = self.state
+        events = self.events
+        while not state.finished:
+            while (self.position < len(events) and
+                    events[self.position][0] == state.ticks):
+                apply_action(state, events[self.position][1])
+                self.position += 1
+                if state.finished:
+                    return state
+            if state.ticks >= tick or state.ticks == self.end_tick:
+                break
+            apply_gravity(state)
+            self.snapshot()
+        return state
+
+    def seek(self, tick):
+        """ Return the game state at a tick, from the nearest snapshot. """
+        if tick < self.state.ticks:
+            start = max(
+                (t for t in self.snapshots if t <= tick), default=None
+            )
+            if start is None:
+                self.state = GameState(self.seed)
+                self.position = 0
+            else:
+                state, self.position = self.snapshots[start]
+                self.state = state.copy()
+        return self.advance_to(tick)
+
+    def play(self):
+        """ Play the whole game at full speed and return the final state. """
+        end = self.end_tick if self.end_tick is not None else float("inf")
+        return self.advance_to(end)
+
+
+def format_board(state):
+    """ Return the board and active piece as lines of text. """
+    grid = [
+        ["#" if row >> c & 1 else "." for c in range(BOARD_WIDTH)]
+        for row in state.board.rows
+    ]
+    if not state.finished:
+        for r, c in state.current_piece.get_coords():
+            if 0 <= r < BOARD_HEIGHT:
+                grid[r][c] = "@"
+    return "\n".join("".join(row) for row in grid)
+
+
+def main():
+    """ Command-line entry point: replay a game and report its result. """
+    parser = argparse.ArgumentParser(
+        description="Replay a recorded Tetris game without rendering."
+    )
+    parser.add_argument("path", help="replay file")
+    parser.add_argument("--seek", type=int, metavar="TICK",
+                        help="show the game at TICK instead of the end")
+    parser.add_argument("--score", type=int,
+                        help="exit with status 1 unless the score "
+                             "matches SCORE")
+    parser.add_argument("--board", action="store_true",
+                        help="print the board")
+    args = parser.parse_args()
+
+    with open(args.path, "rb") as f:
+        data = f.read()
+    player = ReplayPlayer(data)
+
+    start = time.perf_counter()
+    if args.seek is not None:
+        state = player.seek(args.seek)
+    else:
+        state = player.play()
+    elapsed = time.perf_counter() - start
+
+    print(f"Replay: {len(data)} bytes, seed {player.seed}, "
+          f"{len(player.events)} actions")
+    print(f"Tick {state.ticks}: score {state.score}, lines {state.lines}, "
+          f"level {state.level}, pieces {state.pieces}"
+          f"{' (ended)' if state.finished else ''}")
+    print(f"Replayed in {elapsed * 1000:.1f} ms")
+    if args.board:
+        print(format_board(state))
+
+    if args.score is not None and state.score != args.score:
+        print(f"Score mismatch: claimed {args.score}, replay {state.score}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,18 @@
+import time
+import metrics  # First, so the time of every other import is recorded
 from user_interface import show_welcome_screen
 from game_logic import game_logic
+from highscores import start_connecting
 
 
 def main():
     """
-    Entry point for the Tetris game: shows welcome screen and
+    Entry point for the Tetris game: starts connecting to the
+    leaderboard in the background, shows welcome screen and
     starts the game loop.
     """
+    metrics.record("startup", time.perf_counter() - metrics.STARTED)
+    start_connecting()
     show_welcome_screen()
     game_logic()
 
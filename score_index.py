@@ -0,0 +1,121 @@
+from bisect import bisect_left, insort
+from constants import PIECE_POINTS
+
+
+# Scores are normally multiples of the points for one piece, so one
+# bucket per multiple keeps the tree small and most buckets to a single
+# score. Each bucket keeps its entries sorted, highest score first, so
+# ranks stay exact for any other score too.
+SCORE_BUCKET = PIECE_POINTS
+INITIAL_CAPACITY = 1024
+# The tree never grows past this many buckets (scores up to about 1.3
+# million). Higher scores, such as a bogus row in the sheet, share the
+# last bucket instead of growing the tree without bound.
+MAX_CAPACITY = 1 << 17
+
+
+class ScoreIndex:
+    """
+    Order-statistics index over leaderboard scores: a Fenwick tree of
+    counts per score bucket, plus the names and scores in each bucket,
+    highest first. Adding a score, rank, percentile and lookup by rank
+    take logarithmic time, plus the size of one bucket.
+    """
+    def __init__(self, bucket=SCORE_BUCKET, capacity=INITIAL_CAPACITY,
+                 max_capacity=MAX_CAPACITY):
+        self.bucket = bucket
+        self.capacity = capacity
+        self.max_capacity = max_capacity
+        self.tree = [0] * (capacity + 1)
+        self.names = {}
+        self.total = 0
+
+    def bucket_of(self, score):
+        """ Return the tree bucket for a score, clamped to the last one. """
+        return min(max(0, int(score) // self.bucket), self.max_capacity - 1)
+
+    def update(self, b, delta):
+        """ Add delta to the count of bucket b. """
+        i = b + 1
+        while i <= self.capacity:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, b):
+        """ Return the number of scores in buckets 0..b. """
+        count = 0
+        i = min(b + 1, self.capacity)
+        while i > 0:
+            count += self.tree[i]
+            i -= i & -i
+        return count
+
+    def grow(self, b):
+        """ Enlarge the tree so bucket b fits, rebuilding its counts. """
+        capacity = self.capacity
+        while capacity <= b:
+            capacity *= 2
+        self.capacity = capacity
+        self.tree = [0] * (capacity + 1)
+        for existing, names in self.names.items():
+            self.update(existing, len(names))
+
+    def add(self, name, score):
+        """ Add one score to the index. """
+        b = self.bucket_of(score)
+        if b >= self.capacity:
+            self.grow(b)
+        insort(self.names.setdefault(b, []), (name, int(score)),
+               key=negated_score)
+        self.update(b, 1)
+        self.total += 1
+
+    def count_above(self, score):
+        """ Return the number of indexed scores higher than score. """
+        b = self.bucket_of(score)
+        entries = self.names.get(b, ())
+        higher = bisect_left(entries, -score, key=negated_score)
+        return self.total - self.prefix(b) + higher
+
+    def rank(self, score):
+        """ Return the 1-based rank a score has on the leaderboard. """
+        return self.count_above(score) + 1
+
+    def percentile(self, score):
+        """ Return the percentage of indexed scores at or below score. """
+        if not self.total:
+            return 100.0
+        return 100.0 * (self.total - self.count_above(score)) / self.total
+
+    def find(self, k):
+        """ Return the lowest bucket whose prefix count reaches k. """
+        pos = 0
+        step = 1 << self.capacity.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= self.capacity and self.tree[nxt] < k:
+                pos = nxt
+                k -= self.tree[nxt]
+            step >>= 1
+        return pos
+
+    def entry_at(self, rank):
+        """ Return the (name, score) at a 1-based rank, highest first. """
+        b = self.find(self.total - rank + 1)
+        higher = self.total - self.prefix(b)
+        return self.names[b][rank - higher - 1]
+
+    def around(self, score, radius=2):
+        """
+        Return up to radius entries on either side of where score
+        ranks, as (rank, name, score) tuples.
+        """
+        rank = self.rank(score)
+        first = max(1, rank - radius)
+        last = min(self.total, rank + radius)
+        return [(r, *self.entry_at(r)) for r in range(first, last + 1)]
+
+
+def negated_score(entry):
+    """ Sort key that orders (name, score) entries highest first. """
+    return -entry[1]
@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from engine import GameState, step
+from bot import BotPlayer
+from constants import LEFT, RIGHT, DOWN, ROTATE
+
+
+def random_policy(rng):
+    """ Policy that presses a random key (or none) every tick. """
+    actions = (None, LEFT, RIGHT, DOWN, ROTATE)
+    return lambda state: rng.choice(actions)
+
+
+def idle_policy(rng):
+    """ Policy that never presses a key and lets pieces fall. """
+    return lambda state: None
+
+
+def bot_policy(rng):
+    """ Policy driven by the built-in placement-search bot. """
+    return BotPlayer()
+
+
+# Policy factories by name. Each takes a seeded random.Random and
+# returns a callable mapping a GameState to the next action.
+POLICIES = {
+    "random": random_policy,
+    "idle": idle_policy,
+    "bot": bot_policy,
+}
+
+
+def play_game(seed, policy_name, max_ticks):
+    """ Play one headless game and return its statistics. """
+    state = GameState(seed)
+    policy = POLICIES[policy_name](random.Random(seed))
+    while not state.finished and state.ticks < max_ticks:
+        step(state, policy(state))
+    return {
+        "seed": seed,
+        "score": state.score,
+        "lines": state.lines,
+        "level": state.level,
+        "pieces": state.pieces,
+        "ticks": state.ticks,
+    }
+
+
+def play_chunk(seeds, policy_name, max_ticks):
+    """ Play a chunk of games in one worker to keep IPC overhead low. """
+    return [play_game(seed, policy_name, max_ticks) for seed in seeds]
+
+
+def game_seeds(seed, games):
+    """ Derive one seed per game from the run seed. """
+    rng = random.Random(seed)
+    return [rng.getrandbits(32) for _ in range(games)]
+
+
+def percentile(sorted_values, pct):
+    """ Nearest-rank percentile of an already sorted list. """
+    if not sorted_values:
+        return 0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(results, elapsed):
+    """ Aggregate per-game results into run statistics. """
+    scores = sorted(r["score"] for r in results)
+    lines = [r["lines"] for r in results]
+    pieces = [r["pieces"] for r in results]
+    levels = {}
+    for r in results:
+        levels[r["level"]] = levels.get(r["level"], 0) + 1
+
+    return {
+        "games": len(results),
+        "score": {
+            "min": scores[0],
+            "mean": statistics.fmean(scores),
+            "stdev": statistics.pstdev(scores),
+            "p10": percentile(scores, 10),
+            "p50": percentile(scores, 50),
+            "p90": percentile(scores, 90),
+            "p99": percentile(scores, 99),
+            "max": scores[-1],
+        },
+        "lines": {"mean": statistics.fmean(lines), "max": max(lines)},
+        "levels": {str(k): levels[k] for k in sorted(levels)},
+        "pieces": {"mean": statistics.fmean(pieces), "total": sum(pieces)},
+        "elapsed": elapsed,
+        "games_per_second": len(results) / elapsed if elapsed else 0.0,
+    }
+
+
+def run_selfplay(games, seed=0, workers=None, policy="random",
+                 chunk_size=None, max_ticks=100000):
+    """
+    Play games headless across a process pool and return aggregated
+    statistics. Results depend only on the seed, not on the number of
+    workers or the chunk size.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy: {policy}")
+
+    workers = workers or os.cpu_count() or 1
+    seeds = game_seeds(seed, games)
+    if chunk_size is None:
+        chunk_size = max(1, games // (workers * 4))
+    chunks = [
+        seeds[i:i + chunk_size] for i in range(0, len(seeds), chunk_size)
+    ]
+
+    start = time.perf_counter()
+    if workers == 1:
+        batches = [play_chunk(c, policy, max_ticks) for c in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            batches = list(pool.map(
+                play_chunk,
+                chunks,
+                [policy] * len(chunks),
+                [max_ticks] * len(chunks)
+            ))
+    elapsed = time.perf_counter() - start
+
+    results = [r for batch in batches for r in batch]
+    return summarize(results, elapsed)
+
+
+def main():
+    """ Command-line entry point for self-play runs. """
+    parser = argparse.ArgumentParser(
+        description="Run seeded headless Tetris games across all cores."
+    )
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--policy", choices=sorted(POLICIES),
+                        default="random")
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--max-ticks", type=int, default=100000)
+    parser.add_argument("--json", action="store_true",
+                        help="print the statistics as JSON")
+    args = parser.parse_args()
+
+    stats = run_selfplay(
+        args.games,
+        seed=args.seed,
+        workers=args.workers,
+        policy=args.policy,
+        chunk_size=args.chunk_size,
+        max_ticks=args.max_ticks
+    )
+
+    if args.json:
+        print(json.dumps(stats, indent=2))
+        return
+
+    score = stats["score"]
+    print(f"Games:        {stats['games']}")
+    print(
+        f"Score:        mean {score['mean']:.1f}  p50 {score['p50']}  "
+        f"p90 {score['p90']}  max {score['max']}"
+    )
+    print(
+        f"Lines:        mean {stats['lines']['mean']:.2f}  "
+        f"max {stats['lines']['max']}"
+    )
+    print(f"Levels:       {stats['levels']}")
+    print(f"Pieces:       {stats['pieces']['total']}")
+    print(f"Games/sec:    {stats['games_per_second']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,622 @@
+import argparse
+import asyncio
+import codecs
+import os
+import time
+import metrics  # First, so the time of every other import is recorded
+from rich.console import Console
+from rich.live import Live
+from rich.markup import escape
+from game_logic import GameDriver
+from replay import REPLAY_DIR
+from highscores import (
+    get_high_scores,
+    get_rank,
+    submit_score,
+    start_connecting
+)
+from input_pump import KeyRepeat
+from user_interface import (
+    render_welcome_panel,
+    render_rank,
+    render_full_leaderboard_panel,
+    render_game_over_panel,
+    render_score_saved_panel
+)
+
+
+# The Node front end connects here, one connection per player, and
+# relays raw terminal input and output like it does for a pty
+SOCKET_PATH = os.getenv("GAME_SERVER_SOCKET", "tetris.sock")
+# Spectators connect here to watch live games; defaults to the game
+# socket's path plus ".watch"
+WATCH_SOCKET_PATH = os.getenv("GAME_WATCH_SOCKET")
+SCREEN_WIDTH = 80
+SCREEN_HEIGHT = 24
+READ_SIZE = 1024
+MAX_NAME_LENGTH = 10
+
+# Frames queued for a spectator before it counts as too slow, and its
+# queued frames are dropped until the next full frame
+VIEWER_QUEUE_FRAMES = 8
+# Sent before a spectator's first full frame: hide the cursor, clear
+# the screen and move home, where rich.Live then draws the frame
+VIEWER_SYNC = b"\x1b[?25l\x1b[2J\x1b[H"
+GAME_OVER_PAUSE = 3
+
+# Final characters of the cursor key escape sequences, in both the
+# normal (ESC [ A) and application (ESC O A) cursor modes
+ESCAPE_KEYS = {
+    "A": "KEY_UP",
+    "B": "KEY_DOWN",
+    "C": "KEY_RIGHT",
+    "D": "KEY_LEFT",
+}
+
+
+class SessionClosed(Exception):
+    """ Raised when a player disconnects. """
+
+
+class PlayerQuit(Exception):
+    """ Raised when a player presses Q outside of a game. """
+
+
+class KeyParser:
+    """
+    Turns the raw bytes a terminal sends into key names, like blessed
+    does for a local terminal: "KEY_UP", "KEY_ENTER", "KEY_BACKSPACE"
+    and so on for special keys, or the character typed. Escape
+    sequences split across reads are kept until the rest arrives.
+    """
+    __slots__ = ("decoder", "pending")
+
+    def __init__(self):
+        self.decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self.pending = ""
+
+    def feed(self, data):
+        """ Parse a chunk of input. Returns the list of keys in it. """
+        text = self.pending + self.decoder.decode(data)
+        self.pending = ""
+        keys = []
+        i = 0
+        while i < len(text):
+            ch = text[i]
+            if ch == "\x1b":
+                if i + 1 == len(text):
+                    self.pending = text[i:]
+                    break
+                if text[i + 1] not in "[O":
+                    i += 1  # Alt+key or a lone Escape; ignored
+                    continue
+                # Skip parameters up to the sequence's final character
+                j = i + 2
+                while j < len(text) and not "@" <= text[j] <= "~":
+                    j += 1
+                if j == len(text):
+                    self.pending = text[i:]
+                    break
+                if j == i + 2 and text[j] in ESCAPE_KEYS:
+                    keys.append(ESCAPE_KEYS[text[j]])
+                i = j + 1
+                continue
+            if ch == "\r" or ch == "\n":
+                if not (ch == "\n" and i and text[i - 1] == "\r"):
+                    keys.append("KEY_ENTER")
+            elif ch in "\x7f\x08":
+                keys.append("KEY_BACKSPACE")
+            elif ch.isprintable():
+                keys.append(ch)
+            i += 1
+        return keys
+
+
+class StreamOutput:
+    """
+    File-like object that lets a rich Console write straight to a
+    session's socket. Writes are buffered by the transport; drain()
+    waits until the player has caught up. There is no pty to turn line
+    feeds into CRLF, so write() does it.
+    """
+    __slots__ = ("writer", "frame")
+    encoding = "utf-8"
+
+    def __init__(self, writer):
+        self.writer = writer
+        # Output since the last frame was taken, while broadcasting
+        self.frame = None
+
+    def write(self, text):
+        data = text.replace("\n", "\r\n").encode("utf-8")
+        if not self.writer.is_closing():
+            self.writer.write(data)
+        if self.frame is not None:
+            self.frame.append(data)
+        return len(text)
+
+    def take_frame(self):
+        """ Return the bytes written since the frame was last taken. """
+        data = b"".join(self.frame)
+        self.frame = []
+        return data
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return True
+
+    async def drain(self):
+        """ Wait for buffered output to be sent. """
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            raise SessionClosed()
+
+
+class Viewer:
+    """
+    One spectator's end of a broadcast. Frames are queued without
+    waiting and written by follow(). When the queue is full, the
+    viewer is too slow: its queued frames are dropped, and it skips
+    ahead to the next full frame instead of falling further behind.
+    """
+    __slots__ = ("writer", "frames", "synced")
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.frames = asyncio.Queue(VIEWER_QUEUE_FRAMES)
+        self.synced = False
+
+    def send(self, data, keyframe):
+        """
+        Queue a frame: the bytes that update the screen from the last
+        frame, or the whole screen for a keyframe. Returns False if
+        the viewer is waiting for a keyframe.
+        """
+        if not self.synced:
+            if not keyframe:
+                return False
+            data = VIEWER_SYNC + data
+        try:
+            self.frames.put_nowait(data)
+        except asyncio.QueueFull:
+            self.drop()
+            return False
+        self.synced = True
+        return True
+
+    def drop(self):
+        """ Drop every queued frame and wait for the next keyframe. """
+        dropped = 0
+        while not self.frames.empty():
+            self.frames.get_nowait()
+            dropped += 1
+        metrics.count("dropped_viewer_frames", dropped)
+        self.synced = False
+
+    def end(self):
+        """ Stop follow() once the queued frames are written. """
+        if self.frames.full():
+            self.drop()
+        self.frames.put_nowait(None)
+
+    async def follow(self):
+        """ Write queued frames to the spectator until the game ends. """
+        while True:
+            data = await self.frames.get()
+            if data is None:
+                return
+            self.writer.write(data)
+            try:
+                await self.writer.drain()
+            except ConnectionError:
+                raise SessionClosed()
+
+
+class Broadcast:
+    """
+    A live game that spectators can watch. Each frame is rendered and
+    encoded once, for the player, and the same bytes are queued for
+    every viewer. A full frame is requested when a viewer joins or
+    has dropped frames.
+    """
+    __slots__ = ("viewers", "score", "keyframe_wanted", "ended")
+
+    def __init__(self):
+        self.viewers = set()
+        self.score = 0
+        self.keyframe_wanted = False
+        self.ended = False
+
+    def add(self, viewer):
+        viewer.synced = False
+        self.viewers.add(viewer)
+        self.keyframe_wanted = True
+        if self.ended:
+            viewer.end()
+
+    def remove(self, viewer):
+        self.viewers.discard(viewer)
+
+    def publish(self, data, keyframe, score):
+        """ Fan a frame out to every viewer. """
+        self.score = score
+        if keyframe:
+            self.keyframe_wanted = False
+        if not data:
+            return
+        for viewer in self.viewers:
+            if not viewer.send(data, keyframe):
+                self.keyframe_wanted = True
+
+    def end(self):
+        self.ended = True
+        for viewer in self.viewers:
+            viewer.end()
+
+
+class LiveGames:
+    """ The games being played in this process, for spectators. """
+    def __init__(self):
+        self.games = set()
+        self.changed = asyncio.Event()
+
+    def add(self, game):
+        self.games.add(game)
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def remove(self, game):
+        self.games.discard(game)
+
+    def top(self):
+        """ Return the game with the highest score, or None. """
+        return max(self.games, key=lambda game: game.score, default=None)
+
+    async def wait(self):
+        """ Wait until another game starts. """
+        await self.changed.wait()
+
+
+LIVE_GAMES = LiveGames()
+
+
+class GameSession:
+    """
+    One player's connection: the same screens as the terminal game,
+    driven by asyncio instead of blocking on a tty. Each session has
+    its own game, console and input, while the leaderboard caches in
+    highscores.py are shared by every session in the process. Games
+    are broadcast to spectators while they are played.
+    """
+    __slots__ = (
+        "reader", "writer", "output", "console", "parser", "keys",
+        "reader_task", "driver", "metrics"
+    )
+    farewell = "👋  Thanks for playing!\n"
+    counter = "sessions"
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.output = StreamOutput(writer)
+        self.console = Console(
+            file=self.output,
+            width=SCREEN_WIDTH,
+            height=SCREEN_HEIGHT,
+            force_terminal=True,
+            color_system="256"
+        )
+        self.parser = KeyParser()
+        self.keys = asyncio.Queue()
+        self.reader_task = None
+        # The game being played, if any
+        self.driver = None
+        self.metrics = metrics.from_environment()
+
+    async def read_keys(self):
+        """ Reader task: parse input and queue keys until disconnect. """
+        try:
+            while True:
+                data = await self.reader.read(READ_SIZE)
+                if not data:
+                    break
+                for key in self.parser.feed(data):
+                    self.keys.put_nowait(key)
+        except ConnectionError:
+            pass
+        finally:
+            self.keys.put_nowait(None)
+
+    async def next_key(self, timeout=None):
+        """
+        Wait for the next key, or until timeout seconds have passed.
+        Returns None on timeout; raises SessionClosed on disconnect.
+        """
+        try:
+            key = await asyncio.wait_for(self.keys.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if key is None:
+            raise SessionClosed()
+        return key
+
+    async def poll(self, repeat, timeout):
+        """
+        Wait up to timeout seconds for input, then take every queued
+        key. Returns the list of game actions received, in order.
+        """
+        keys = []
+        key = await self.next_key(max(0.0, timeout))
+        while key is not None:
+            keys.append(key)
+            key = None
+            if not self.keys.empty():
+                key = self.keys.get_nowait()
+                if key is None:
+                    raise SessionClosed()
+        return repeat.actions(keys)
+
+    async def show(self, *renderables):
+        """ Clear the screen, print centred renderables and send them. """
+        self.console.clear()
+        for renderable in renderables:
+            self.console.print(renderable, justify="center")
+        await self.output.drain()
+
+    async def wait_for(self, *choices):
+        """ Wait for one of the given keys; Q always ends the session. """
+        while True:
+            key = await self.next_key()
+            if key.lower() == "q":
+                raise PlayerQuit()
+            if key in choices or key.lower() in choices:
+                return key.lower() if len(key) == 1 else key
+
+    async def leaderboard_toggle(self, panel, choices):
+        """
+        Show a game over panel, switching to the full leaderboard and
+        back with L, until one of the other choices is pressed.
+        """
+        leaderboard_visible = False
+        while True:
+            if leaderboard_visible:
+                high_scores_text = await asyncio.to_thread(
+                    get_high_scores, 20, True
+                )
+                await self.show(
+                    render_full_leaderboard_panel(high_scores_text),
+                    "\nPress [bold cyan]L[/bold cyan] to return."
+                )
+            else:
+                await self.show(panel)
+            key = await self.wait_for("l", *choices)
+            if key != "l":
+                return key
+            leaderboard_visible = not leaderboard_visible
+
+    async def play(self, seed=None, replay_dir=REPLAY_DIR):
+        """
+        Play one game, from a random seed unless one is given, and save
+        its replay to replay_dir. Returns the score and whether Q was
+        pressed.
+        """
+        driver = self.driver = GameDriver(
+            await asyncio.to_thread(get_high_scores),
+            seed=seed,
+            console=self.console
+        )
+        state = driver.state
+        repeat = KeyRepeat()
+        broadcast = Broadcast()
+        self.output.frame = []
+        LIVE_GAMES.add(broadcast)
+        try:
+            with Live(console=self.console, auto_refresh=False,
+                      redirect_stdout=False, redirect_stderr=False) as live:
+                driver.start(live, time.monotonic())
+                broadcast.publish(self.output.take_frame(), True, 0)
+                await self.output.drain()
+                while not state.finished:
+                    with metrics.phase("input_wait"):
+                        actions = await self.poll(
+                            repeat, driver.deadline() - time.monotonic()
+                        )
+                    driver.apply_actions(actions)
+                    driver.advance(live, time.monotonic())
+                    broadcast.publish(
+                        self.output.take_frame(), False, state.score
+                    )
+                    if broadcast.keyframe_wanted:
+                        driver.compositor.redraw(live)
+                        broadcast.publish(
+                            self.output.take_frame(), True, state.score
+                        )
+                    await self.output.drain()
+        finally:
+            LIVE_GAMES.remove(broadcast)
+            broadcast.end()
+            self.output.frame = None
+            self.driver = None
+            driver.finish(replay_dir)
+        return state.score, state.quit_requested
+
+    async def read_name(self):
+        """
+        Line editor for the leaderboard name. Typing past the limit
+        shows a warning, and Enter is ignored until the name fits.
+        """
+        name = ""
+        while True:
+            warning = ""
+            if len(name) > MAX_NAME_LENGTH:
+                warning = (
+                    f"\n[red]Maximum {MAX_NAME_LENGTH} characters "
+                    "allowed.[/red]"
+                )
+            await self.show(
+                "\n[bold cyan]Enter a username for the leaderboard:"
+                "[/bold cyan]\n(max 10 characters, or press "
+                "[cyan]Enter[/cyan] to skip)\n",
+                f"> {escape(name)}{warning}"
+            )
+            key = await self.next_key()
+            if key == "KEY_ENTER":
+                if len(name) <= MAX_NAME_LENGTH:
+                    return name.strip()
+            elif key == "KEY_BACKSPACE":
+                name = name[:-1]
+            elif len(key) == 1 and key.isprintable():
+                name += key
+
+    async def run(self):
+        """ Welcome screen, then games until the player quits. """
+        connected = time.perf_counter()
+        await self.show(render_welcome_panel())
+        metrics.record("first_frame", time.perf_counter() - connected)
+        await self.wait_for("KEY_ENTER")
+
+        while True:
+            score, quit_requested = await self.play()
+            if quit_requested:
+                return
+
+            rank = await asyncio.to_thread(get_rank, score)
+            choice = await self.leaderboard_toggle(
+                render_game_over_panel(score, render_rank(score, rank)),
+                ("r", "KEY_ENTER")
+            )
+            if choice == "KEY_ENTER":
+                name = await self.read_name() or "Player"
+                await asyncio.to_thread(submit_score, name, score)
+                await self.leaderboard_toggle(
+                    render_score_saved_panel(score), ("r",)
+                )
+
+    async def serve(self):
+        """
+        Run the session until the player quits or disconnects. Metrics
+        recorded meanwhile, by this task and the tasks and threads it
+        starts, go to the session's own report, written when it ends.
+        The process report counts the sessions.
+        """
+        metrics.CURRENT.set(self.metrics)
+        metrics.METRICS.count(self.counter)
+        self.reader_task = asyncio.create_task(self.read_keys())
+        try:
+            try:
+                await self.run()
+            except PlayerQuit:
+                pass
+            await self.show(self.farewell)
+        except SessionClosed:
+            pass
+        finally:
+            self.reader_task.cancel()
+            self.writer.close()
+            await asyncio.to_thread(self.metrics.dump)
+
+
+class SpectatorSession(GameSession):
+    """
+    A spectator's connection: watches the highest scoring live game,
+    then the next one when it ends, until Q is pressed. Spectators
+    only read frames the players' games have already rendered.
+    """
+    __slots__ = ()
+    farewell = "👋  Thanks for watching!\n"
+    counter = "spectators"
+
+    async def watch(self, game):
+        """ Follow a game until it ends, then show its final score. """
+        viewer = Viewer(self.writer)
+        game.add(viewer)
+        try:
+            await viewer.follow()
+        finally:
+            game.remove(viewer)
+        await self.show(
+            f"\n[bold red]GAME OVER[/bold red]\n\nFinal score: {game.score}"
+        )
+        await asyncio.sleep(GAME_OVER_PAUSE)
+
+    async def run(self):
+        """ Watch games until the spectator presses Q or disconnects. """
+        quit_task = asyncio.create_task(self.wait_for())
+        try:
+            while True:
+                game = LIVE_GAMES.top()
+                if game is None:
+                    await self.show(
+                        "\n[bold cyan]Waiting for a game to start...[/bold "
+                        "cyan]\n\nPress [magenta]Q[/magenta] to stop "
+                        "watching."
+                    )
+                    task = asyncio.create_task(LIVE_GAMES.wait())
+                else:
+                    task = asyncio.create_task(self.watch(game))
+                await asyncio.wait(
+                    (quit_task, task), return_when=asyncio.FIRST_COMPLETED
+                )
+                if quit_task.done():
+                    task.cancel()
+                    quit_task.result()  # Raises PlayerQuit or SessionClosed
+                task.result()
+        finally:
+            quit_task.cancel()
+
+
+async def handle_connection(reader, writer):
+    """ Connection handler: host one game session. """
+    await GameSession(reader, writer).serve()
+
+
+async def handle_spectator(reader, writer):
+    """ Connection handler: let a spectator watch live games. """
+    await SpectatorSession(reader, writer).serve()
+
+
+async def start_server(handler, path):
+    """ Start serving connections on a Unix socket. """
+    if os.path.exists(path):
+        os.remove(path)  # Left behind by an earlier server
+    server = await asyncio.start_unix_server(handler, path=path)
+    print(f"Tetris server listening on {path}")
+    return server
+
+
+async def serve(path=SOCKET_PATH, watch_path=WATCH_SOCKET_PATH):
+    """ Serve game and spectator sessions until cancelled. """
+    server = await start_server(handle_connection, path)
+    watch_server = await start_server(
+        handle_spectator, watch_path or f"{path}.watch"
+    )
+    async with server, watch_server:
+        await asyncio.gather(
+            server.serve_forever(), watch_server.serve_forever()
+        )
+
+
+def main():
+    """ Command-line entry point for the multi-session server. """
+    parser = argparse.ArgumentParser(
+        description="Host many Tetris sessions in one process."
+    )
+    parser.add_argument("--socket", default=SOCKET_PATH,
+                        help="Unix socket path to listen on")
+    parser.add_argument("--watch-socket", default=WATCH_SOCKET_PATH,
+                        help="Unix socket path for spectators "
+                             "(default: the game socket plus .watch)")
+    args = parser.parse_args()
+
+    start_connecting()
+    try:
+        asyncio.run(serve(args.socket, args.watch_socket))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
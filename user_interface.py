@@ -1,17 +1,27 @@
 import sys
+import time
 from rich.console import Console
 from rich.panel import Panel
+from rich.layout import Layout
+from rich.markup import escape
 from blessed import Terminal
-from constants import EMPTY
+from board import board_rows
+import metrics
+from constants import (
+    EMPTY,
+    BOARD_WIDTH,
+    BOARD_HEIGHT,
+    LINE_CLEAR_FRAMES,
+    LINE_CLEAR_FRAME_TIME
+)
 
 
 console = Console()
 term = Terminal()
 
 
-def show_welcome_screen():
-    """ Display the welcome screen with game instructions and controls. """
-    console.clear()
+def render_welcome_panel():
+    """ Create the welcome panel with game instructions and controls. """
     welcome_text = """[bold magenta]
 Welcome to Tetris!
 [/bold magenta]
@@ -23,17 +33,25 @@ and 100 for every row cleared.
 [cyan]←[/cyan] Move Left
 [cyan]→[/cyan] Move Right
 [cyan]↓[/cyan] Soft Drop
+[cyan]Space[/cyan] Hard Drop
 [cyan]↑[/cyan] Rotate
 [magenta]Q[/magenta] Quit
 
 Press [green]Enter[/green] to begin...
 """
-    console.print(Panel(
+    return Panel(
         welcome_text,
         title="TETRIS",
         border_style="cyan",
         width=60
-        ), justify="center")
+        )
+
+
+def show_welcome_screen():
+    """ Display the welcome screen with game instructions and controls. """
+    console.clear()
+    console.print(render_welcome_panel(), justify="center")
+    metrics.record("first_frame", time.perf_counter() - metrics.STARTED)
 
     # Wait for Enter key
     with term.cbreak():
@@ -66,6 +84,29 @@ def render_next_piece(piece):
     return "\n".join(lines)
 
 
+def render_rank(score, rank):
+    """
+    Generate the rank, percentile and scores-around-you text shown
+    after a game. Returns an empty string when no rank is available.
+    """
+    if rank is None:
+        return ""
+    you = rank["rank"]
+    lines = [
+        f"[bold]Rank:[/bold] #{you} of {rank['players']} "
+        f"(top {rank['top_percent']:.1f}%)",
+        ""
+    ]
+    above = [e for e in rank["around"] if e[0] < you]
+    below = [e for e in rank["around"] if e[0] >= you][:len(above) or 2]
+    for r, name, entry_score in above:
+        lines.append(f"{r}. {escape(f'{name:<10}')} {entry_score}")
+    lines.append(f"[bold cyan]{you}. {'You':<10} {score}[/bold cyan]")
+    for r, name, entry_score in below:
+        lines.append(f"{r + 1}. {escape(f'{name:<10}')} {entry_score}")
+    return "\n".join(lines) + "\n"
+
+
 def render_score_panel(score):
     """ Create a Rich panel displaying the current score. """
     return Panel(f"[bold green]{score}[/bold green]", title="SCORE", width=20)
@@ -82,7 +123,313 @@ def render_controls_panel():
         "[bold]←[/bold] Move Left\n"
         "[bold]→[/bold] Move Right\n"
         "[bold]↓[/bold] Soft Drop\n"
+        "[bold]Space[/bold] Hard Drop\n"
         "[bold]↑[/bold] Rotate\n"
         "[bold]Q[/bold] Quit"
     )
     return Panel(controls_text, title="CONTROLS", width=20)
+
+
+def render_game_panel(board):
+    """ Create the Rich panel holding the game board. """
+    return Panel(
+        render_board(board),
+        title="TETRIS",
+        border_style="bold red",
+        width=24
+    )
+
+
+def render_leaderboard_panel(high_scores_text):
+    """ Create the Rich panel showing the leaderboard beside the game. """
+    return Panel(high_scores_text, title="LEADERBOARD", width=24)
+
+
+def render_full_leaderboard_panel(high_scores_text):
+    """ Create the full-screen leaderboard panel shown after a game. """
+    return Panel(
+        high_scores_text,
+        title="LEADERBOARD",
+        border_style="blue",
+        width=50,
+        expand=False
+    )
+
+
+def render_game_over_panel(score, rank_text):
+    """ Create the game over panel offering to save the score. """
+    return Panel(
+        f"""
+[bold]Score:[/bold] {score}
+{rank_text}
+Would you like to record your score?
+
+Press [bold cyan]Enter[/bold cyan] to save your score to the leaderboard,
+[green]R[/green] to restart, [magenta]Q[/magenta] to quit,
+or [blue]L[/blue] to view leaderboard.
+                    """,
+        title="GAME OVER",
+        border_style="red",
+        width=50,
+        expand=False
+    )
+
+
+def render_score_saved_panel(score):
+    """ Create the game over panel shown once the score is saved. """
+    return Panel(
+        f"""
+[bold]Your score has been recorded![/bold]
+
+[bold]Score:[/bold] {score}
+
+Press [green]R[/green] to restart, [magenta]Q[/magenta] to quit,
+or [blue]L[/blue] to view the leaderboard.
+                        """,
+        title="GAME OVER",
+        border_style="red",
+        width=50,
+        expand=False
+    )
+
+
+# Rows for the controls panel: one per control plus the borders
+CONTROLS_HEIGHT = 8
+
+
+def build_layout():
+    """
+    Build the empty layout tree of the game frame with named sections
+    for the game, next, score, controls and leaderboard panels.
+    """
+    layout = Layout()
+    layout.split_row(
+        Layout(name="game", size=24),
+        Layout(name="sidebar", size=28),
+        Layout(name="leaderboard")
+    )
+    layout["sidebar"].split_column(
+        Layout(name="next"),
+        Layout(name="score"),
+        Layout(name="controls", size=CONTROLS_HEIGHT)
+    )
+    return layout
+
+
+def build_frame(board, next_piece, score, high_scores_text):
+    """
+    Build the full 80x24 game frame: the board, the sidebar panels
+    and the leaderboard.
+    """
+    layout = build_layout()
+    layout["game"].update(render_game_panel(board))
+    layout["next"].update(render_next_panel(next_piece))
+    layout["score"].update(render_score_panel(score))
+    layout["controls"].update(render_controls_panel())
+    layout["leaderboard"].update(render_leaderboard_panel(high_scores_text))
+    return Panel(layout, height=24, width=80, border_style="dim")
+
+
+class FrameCompositor:
+    """
+    Keeps one pre-built game frame and rebuilds each panel only when
+    its input changes. The Live display is refreshed only when at least
+    one panel was rebuilt.
+
+    With a playfield renderer, the game panel holds an empty board and
+    the board is drawn over it by the renderer, so rich only redraws
+    the frame when a sidebar panel changes. The renderer is only used
+    while the terminal is big enough for the frame; rich draws the
+    board whenever it is not.
+    """
+    __slots__ = (
+        "layout", "frame", "keys", "renderer", "playfield", "grid", "stale"
+    )
+
+    def __init__(self, playfield=None):
+        self.layout = build_layout()
+        self.layout["controls"].update(render_controls_panel())
+        self.frame = Panel(self.layout, height=24, width=80,
+                           border_style="dim")
+        self.keys = {}
+        self.renderer = playfield
+        # The renderer while it is in use, otherwise None
+        self.playfield = None
+        self.grid = None
+        self.stale = True
+        self.fit_playfield()
+
+    def fit_playfield(self):
+        """
+        Switch the playfield renderer on or off to suit the terminal's
+        current size, so a resize takes effect on the next refresh.
+        Returns True if it was switched.
+        """
+        renderer = self.renderer
+        playfield = renderer if renderer and renderer.fits() else None
+        if playfield is self.playfield:
+            return False
+        self.playfield = playfield
+        self.stale = True
+        if playfield:
+            self.layout["game"].update(render_game_panel(
+                [[EMPTY] * BOARD_WIDTH for _ in range(BOARD_HEIGHT)]
+            ))
+        elif self.grid is not None:
+            self.layout["game"].update(render_game_panel(self.grid))
+        return True
+
+    def set_panel(self, name, key, build):
+        """
+        Rebuild the named panel with build() if key differs from the
+        key it was last built with. Returns True if it was rebuilt.
+        """
+        if name in self.keys and self.keys[name] == key:
+            return False
+        self.keys[name] = key
+        self.layout[name].update(build())
+        self.stale = True
+        return True
+
+    def update_game(self, board, piece):
+        """ Rebuild the game panel if the board or active piece moved. """
+        key = (
+            tuple(board.rows),
+            tuple(board.colors),
+            piece.shape_name,
+            piece.rotation,
+            piece.row,
+            piece.col,
+            piece.emoji
+        )
+        if self.keys.get("game") == key:
+            return False
+        # Stream the board's rows with the piece overlaid; no grid copy
+        rows = board_rows(board, piece, ghost=True)
+        self.grid = rows
+        if not self.playfield:
+            self.layout["game"].update(render_game_panel(rows))
+        self.keys["game"] = key
+        return True
+
+    def update_sidebar(self, next_piece, score, high_scores_text):
+        """ Rebuild the next, score and leaderboard panels as needed. """
+        changed = self.set_panel(
+            "next",
+            (next_piece.shape_name, next_piece.emoji),
+            lambda: render_next_panel(next_piece)
+        )
+        changed |= self.set_panel(
+            "score", score, lambda: render_score_panel(score)
+        )
+        changed |= self.set_panel(
+            "leaderboard",
+            high_scores_text,
+            lambda: render_leaderboard_panel(high_scores_text)
+        )
+        return changed
+
+    def show_grid(self, grid):
+        """
+        Show an arbitrary board grid, e.g. an animation frame. The game
+        panel is rebuilt on the next update_game call.
+        """
+        self.keys.pop("game", None)
+        self.grid = grid
+        if not self.playfield:
+            self.layout["game"].update(render_game_panel(grid))
+
+    def refresh(self, live):
+        """
+        Push the current frame to the display. With a playfield
+        renderer, rich redraws the frame only if a panel changed, and
+        the board is then written as a diff of the last one drawn.
+        """
+        with metrics.phase("live_update"):
+            if self.renderer:
+                self.fit_playfield()
+            if self.stale or not self.playfield:
+                live.update(self.frame, refresh=True)
+                self.stale = False
+                if self.playfield:
+                    self.playfield.invalidate()
+            if self.playfield and self.grid is not None:
+                self.playfield.draw(self.grid)
+        metrics.count("frames")
+
+    def redraw(self, live):
+        """
+        Redraw the whole frame rather than what changed, e.g. for a
+        spectator who has just started watching.
+        """
+        self.stale = True
+        self.refresh(live)
+
+    def draw(self, live, board, piece, next_piece, score, high_scores_text):
+        """
+        Bring the frame up to date with the game state and refresh the
+        display, skipping the refresh entirely when nothing changed.
+        Returns True if the display was refreshed.
+        """
+        with metrics.phase("layout_build"):
+            changed = self.update_game(board, piece)
+            changed |= self.update_sidebar(
+                next_piece, score, high_scores_text
+            )
+        if changed:
+            self.refresh(live)
+        return changed
+
+    def draw_state(self, live, state, high_scores_text):
+        """ Draw the frame for an engine GameState. """
+        return self.draw(
+            live,
+            state.board,
+            state.current_piece,
+            state.next_piece,
+            state.score,
+            high_scores_text
+        )
+
+
+class LineClearAnimation:
+    """
+    Non-blocking wipe effect for cleared rows. The main loop calls
+    advance() as often as it likes; each due frame wipes the next group
+    of columns across all cleared rows at once.
+    """
+    __slots__ = (
+        "board", "full_rows", "frame_time", "columns_per_frame", "col",
+        "next_frame"
+    )
+
+    def __init__(self, board, full_rows, frames=LINE_CLEAR_FRAMES,
+                 frame_time=LINE_CLEAR_FRAME_TIME):
+        self.board = board
+        self.full_rows = full_rows
+        self.frame_time = frame_time
+        self.columns_per_frame = -(-BOARD_WIDTH // frames)
+        self.col = 0
+        self.next_frame = 0.0
+
+    def finished(self, now):
+        """
+        True once every column has been wiped and the last frame has
+        been shown for its full frame time.
+        """
+        return self.col >= BOARD_WIDTH and now >= self.next_frame
+
+    def advance(self, now):
+        """
+        Wipe the next group of columns if a frame is due.
+        Returns True if the board grid changed and should be redrawn.
+        """
+        if self.col >= BOARD_WIDTH or now < self.next_frame:
+            return False
+        end = min(BOARD_WIDTH, self.col + self.columns_per_frame)
+        for idx in self.full_rows:
+            for col in range(self.col, end):
+                self.board[idx][col] = "[white]▓▓[/white]"
+        self.col = end
+        self.next_frame = now + self.frame_time
+        return True